@@ -1,13 +1,65 @@
 """
 Экспорт данных специально для анализа ИИ
 """
+import contextvars
 import json
 import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 from analytics import TelegramAnalytics
+from database import connect_db
 import config
 
+try:
+    import orjson
+except ImportError:  # orjson опционален, без него используем стандартный json
+    orjson = None
+
+# Таблица замены переводов строк и табуляций на пробелы для однострочного вывода
+_NL_TABLE = str.maketrans('\n\r\t', '   ')
+
+# Сколько файлов пакета создается одновременно
+_PACKAGE_WORKERS = 4
+
+# Формат метки времени в именах файлов
+_TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+
+def _timestamp() -> str:
+    """Метка времени для имени файла"""
+    return datetime.now().strftime(_TIMESTAMP_FORMAT)
+
+
+class _PackageCache:
+    """Кэш тяжелых запросов одного вызова create_complete_ai_package"""
+    
+    def __init__(self):
+        self._values: Dict[Any, Any] = {}
+        self._key_locks: Dict[Any, threading.Lock] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key, compute):
+        """Возвращает значение из кэша или вычисляет его"""
+        # Потоки пакета, запросившие один ключ, ждут единственного вычисления
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._values:
+                self._values[key] = compute()
+            return self._values[key]
+
+
+# Кэш текущего пакета. Контекст копируется в задачи пула потоков пакета,
+# поэтому одновременные пакеты (общий экспортер веб-интерфейса) и отдельные
+# вызовы методов не видят чужой кэш
+_package_cache: contextvars.ContextVar[Optional[_PackageCache]] = contextvars.ContextVar(
+    'ai_package_cache', default=None
+)
+
+
 class AIExporter:
     """
     Класс для создания файлов, оптимизированных для загрузки в ИИ
@@ -17,23 +69,50 @@ class AIExporter:
         self.analytics = TelegramAnalytics(db_path)
         self.db_path = db_path
         
+        self._executor_lock = threading.Lock()
+        
+        # Пул потоков для файлов пакета: создается при первом пакете и живет
+        # вместе с экспортером, чтобы не плодить потоки на каждый запрос
+        self._executor: Optional[ThreadPoolExecutor] = None
+        
         # Создаем папку для AI экспортов
         self.ai_export_dir = os.path.join(config.OUTPUT_DIR, 'ai_ready')
         if not os.path.exists(self.ai_export_dir):
             os.makedirs(self.ai_export_dir)
     
+    def _package_executor(self) -> ThreadPoolExecutor:
+        """Пул потоков для файлов пакета; создается при первом пакете"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=_PACKAGE_WORKERS, thread_name_prefix='ai-export'
+                )
+            return self._executor
+    
+    def close(self):
+        """Останавливает пул потоков и закрывает соединения аналитики"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self.analytics.close()
+    
     def create_chat_analysis_file(self, chat_id: int, filename: str = None) -> str:
         """
         Создает файл для анализа конкретного чата
         """
         if filename is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = _timestamp()
             filename = f"chat_{chat_id}_analysis_{timestamp}.json"
         
         filepath = os.path.join(self.ai_export_dir, filename)
         
         # Получаем данные для анализа
-        analysis_data = self.analytics.generate_ai_friendly_summary(chat_id, max_messages=200)
+        analysis_data = self.analytics.generate_ai_friendly_summary(
+            chat_id, max_messages=200,
+            topics=self._get_topics(chat_id),
+            active_chats=self._get_active_chats()[:5]
+        )
         
         # Добавляем дополнительный контекст
         analysis_data['instructions_for_ai'] = {
@@ -53,8 +132,7 @@ class AIExporter:
         }
         
         # Сохраняем файл
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(analysis_data, f, ensure_ascii=False, indent=2)
+        self._write_json(filepath, analysis_data)
         
         print(f"🤖 Создан файл для AI анализа: {filename}")
         print(f"📁 Путь: {filepath}")
@@ -67,41 +145,49 @@ class AIExporter:
         Создает общий обзор всех чатов
         """
         if filename is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = _timestamp()
             filename = f"telegram_overview_{timestamp}.json"
         
         filepath = os.path.join(self.ai_export_dir, filename)
         
-        # Собираем общую статистику
-        overview_data = {
-            'overview_type': 'telegram_full_analysis',
-            'created_at': datetime.now().isoformat(),
-            'most_active_chats': self.analytics.get_most_active_chats(limit=10),
-            'recent_activity': self.analytics.get_activity_by_time(),
-            'global_topics': self.analytics.analyze_conversation_topics(),
-            'changes_summary': self.analytics.get_message_changes_analytics(),
-            'sample_messages': self.analytics.generate_ai_friendly_summary(max_messages=50),
-            
-            'ai_analysis_suggestions': [
-                'Какие чаты наиболее важны для пользователя?',
-                'В какое время пользователь наиболее активен?',
-                'Какие темы чаще всего обсуждаются?',
-                'Как изменился стиль общения со временем?',
-                'Есть ли различия в общении в разных чатах?'
-            ],
-            
-            'insights_to_look_for': [
-                'Паттерны активности по времени',
-                'Различия в стиле общения в разных чатах',
-                'Эволюция тем разговоров',
-                'Социальные связи и взаимодействия',
-                'Эмоциональные паттерны'
-            ]
-        }
+        # Собираем общую статистику через одно соединение и одну транзакцию
+        with connect_db(self.db_path, read_only=True) as conn:
+            conn.execute('BEGIN')
+
+            active_chats = self._get_active_chats(conn=conn)
+            global_topics = self._get_topics(conn=conn)
+
+            overview_data = {
+                'overview_type': 'telegram_full_analysis',
+                'created_at': datetime.now().isoformat(),
+                'most_active_chats': active_chats,
+                'recent_activity': self.analytics.get_activity_by_time(conn=conn),
+                'global_topics': global_topics,
+                'changes_summary': self.analytics.get_message_changes_analytics(conn=conn),
+                'sample_messages': self.analytics.generate_ai_friendly_summary(
+                    max_messages=50, conn=conn,
+                    topics=global_topics, active_chats=active_chats[:5]
+                ),
+                
+                'ai_analysis_suggestions': [
+                    'Какие чаты наиболее важны для пользователя?',
+                    'В какое время пользователь наиболее активен?',
+                    'Какие темы чаще всего обсуждаются?',
+                    'Как изменился стиль общения со временем?',
+                    'Есть ли различия в общении в разных чатах?'
+                ],
+                
+                'insights_to_look_for': [
+                    'Паттерны активности по времени',
+                    'Различия в стиле общения в разных чатах',
+                    'Эволюция тем разговоров',
+                    'Социальные связи и взаимодействия',
+                    'Эмоциональные паттерны'
+                ]
+            }
         
         # Сохраняем файл
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(overview_data, f, ensure_ascii=False, indent=2)
+        self._write_json(filepath, overview_data)
         
         print(f"📊 Создан обзорный файл: {filename}")
         print(f"📁 Путь: {filepath}")
@@ -113,71 +199,79 @@ class AIExporter:
         Создает фрагмент разговора для детального анализа
         """
         if filename is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = _timestamp()
             filename = f"conversation_snippet_{chat_id}_{days}days_{timestamp}.txt"
         
         filepath = os.path.join(self.ai_export_dir, filename)
         
-        import sqlite3
-        with sqlite3.connect(self.db_path) as conn:
+        # Условие выборки сообщений за последние дни
+        period_filter = '''
+            WHERE m.chat_id = ?
+            AND m.is_deleted = 0
+            AND m.text IS NOT NULL
+            AND LENGTH(m.text) > 3
+            AND m.date > datetime('now', ?)
+        '''
+        params = (chat_id, f'-{int(days)} days')
+        
+        with connect_db(self.db_path, read_only=True) as conn, \
+                open(filepath, 'w', encoding='utf-8', buffering=65536) as f:
             conn.row_factory = sqlite3.Row
             
-            # Получаем сообщения за последние дни
-            messages = conn.execute('''
+            # Заголовок требует количества сообщений, поэтому считаем их заранее
+            message_count, chat_name = conn.execute(f'''
+                SELECT
+                    COUNT(*),
+                    (SELECT name FROM chats WHERE id = ?)
+                FROM messages m
+                {period_filter}
+            ''', (chat_id,) + params).fetchone()
+            
+            # Форматируем как читаемый диалог
+            f.write(f"Разговор из чата: {chat_name if message_count else 'Unknown'}\n")
+            f.write(f"Период: последние {days} дней\n")
+            f.write(f"Количество сообщений: {message_count}\n")
+            f.write("=" * 50 + "\n\n")
+            
+            # Сообщения пишем в файл по мере чтения курсора
+            messages = conn.execute(f'''
                 SELECT 
                     m.text,
-                    m.date,
+                    strftime('%H:%M', m.date) as hm,
                     COALESCE(u.first_name, u.username, 'User_' || u.id) as author_name,
-                    c.name as chat_name
+                    CASE
+                        WHEN DATE(m.date) IS NOT LAG(DATE(m.date)) OVER (ORDER BY m.date)
+                        THEN DATE(m.date)
+                    END as new_day
                 FROM messages m
                 LEFT JOIN users u ON m.sender_id = u.id
-                LEFT JOIN chats c ON m.chat_id = c.id
-                WHERE m.chat_id = ? 
-                AND m.is_deleted = FALSE 
-                AND m.text IS NOT NULL 
-                AND LENGTH(m.text) > 3
-                AND m.date > datetime('now', '-{} days')
+                {period_filter}
                 ORDER BY m.date ASC
-            '''.format(days), (chat_id,)).fetchall()
-        
-        # Форматируем как читаемый диалог
-        conversation_text = f"Разговор из чата: {messages[0]['chat_name'] if messages else 'Unknown'}\n"
-        conversation_text += f"Период: последние {days} дней\n"
-        conversation_text += f"Количество сообщений: {len(messages)}\n"
-        conversation_text += "=" * 50 + "\n\n"
-        
-        current_date = None
-        for msg in messages:
-            msg_date = msg['date'][:10]  # Берем только дату
+            ''', params)
             
-            # Добавляем разделитель по дням
-            if current_date != msg_date:
-                conversation_text += f"\n--- {msg_date} ---\n"
-                current_date = msg_date
+            for msg in messages:
+                # Добавляем разделитель по дням (смену дня отмечает LAG в запросе)
+                if msg['new_day']:
+                    f.write(f"\n--- {msg['new_day']} ---\n")
+                
+                # Форматируем сообщение (время HH:MM уже выделено в запросе)
+                author = msg['author_name']
+                text = msg['text'].translate(_NL_TABLE)  # Убираем переносы строк
+                
+                f.write(f"[{msg['hm']}] {author}: {text}\n")
             
-            # Форматируем сообщение
-            time = msg['date'][11:16]  # Время HH:MM
-            author = msg['author_name']
-            text = msg['text'].replace('\n', ' ')  # Убираем переносы строк
-            
-            conversation_text += f"[{time}] {author}: {text}\n"
-        
-        # Добавляем инструкции для ИИ
-        conversation_text += "\n" + "=" * 50 + "\n"
-        conversation_text += "ИНСТРУКЦИИ ДЛЯ АНАЛИЗА:\n"
-        conversation_text += "1. Проанализируй стиль общения каждого участника\n"
-        conversation_text += "2. Определи основные темы разговора\n"
-        conversation_text += "3. Найди интересные паттерны взаимодействия\n"
-        conversation_text += "4. Оцени тон и настроение разговора\n"
-        conversation_text += "5. Выдели ключевые моменты диалога\n"
-        
-        # Сохраняем файл
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(conversation_text)
+            # Добавляем инструкции для ИИ
+            f.write("\n" + "=" * 50 + "\n")
+            f.write("ИНСТРУКЦИИ ДЛЯ АНАЛИЗА:\n")
+            f.write("1. Проанализируй стиль общения каждого участника\n")
+            f.write("2. Определи основные темы разговора\n")
+            f.write("3. Найди интересные паттерны взаимодействия\n")
+            f.write("4. Оцени тон и настроение разговора\n")
+            f.write("5. Выдели ключевые моменты диалога\n")
         
         print(f"💬 Создан фрагмент разговора: {filename}")
         print(f"📁 Путь: {filepath}")
-        print(f"📝 Сообщений: {len(messages)}")
+        print(f"📝 Сообщений: {message_count}")
         
         return filepath
     
@@ -186,13 +280,13 @@ class AIExporter:
         Создает файл с анализом тем для ИИ
         """
         if filename is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = _timestamp()
             filename = f"topics_analysis_{timestamp}.json"
         
         filepath = os.path.join(self.ai_export_dir, filename)
         
         # Анализируем темы
-        topics_data = self.analytics.analyze_conversation_topics()
+        topics_data = self._get_topics()
         
         # Добавляем контекст для ИИ
         ai_topics_data = {
@@ -220,8 +314,7 @@ class AIExporter:
         }
         
         # Сохраняем файл
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(ai_topics_data, f, ensure_ascii=False, indent=2)
+        self._write_json(filepath, ai_topics_data)
         
         print(f"🏷️ Создан файл анализа тем: {filename}")
         print(f"📁 Путь: {filepath}")
@@ -235,28 +328,43 @@ class AIExporter:
         print("🎯 Создаем полный пакет для AI анализа...")
         
         package_files = {}
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timestamp = _timestamp()
+        cache_token = _package_cache.set(_PackageCache())
         
         try:
-            # 1. Общий обзор
-            package_files['overview'] = self.create_overview_file(
-                f"overview_{timestamp}.json"
-            )
+            # Файлы независимы друг от друга, поэтому создаем их параллельно;
+            # запросы потоков идут через пул соединений аналитики.
+            # Каждая задача выполняется в копии контекста с кэшем этого пакета
+            pool = self._package_executor()
             
-            # 2. Анализ тем
-            package_files['topics'] = self.create_topic_analysis_file(
-                f"topics_{timestamp}.json"
-            )
+            def submit(fn, *args, **kwargs):
+                return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+            
+            futures = {
+                # 1. Общий обзор
+                'overview': submit(
+                    self.create_overview_file, f"overview_{timestamp}.json"
+                ),
+                # 2. Анализ тем
+                'topics': submit(
+                    self.create_topic_analysis_file, f"topics_{timestamp}.json"
+                )
+            }
             
             # 3. Если указан конкретный чат
             if chat_id:
-                package_files['chat_analysis'] = self.create_chat_analysis_file(
+                futures['chat_analysis'] = submit(
+                    self.create_chat_analysis_file,
                     chat_id, f"chat_{chat_id}_{timestamp}.json"
                 )
-                package_files['conversation'] = self.create_conversation_snippet(
+                futures['conversation'] = submit(
+                    self.create_conversation_snippet,
                     chat_id, days=14, filename=f"conversation_{chat_id}_{timestamp}.txt"
                 )
             
+            for file_type, future in futures.items():
+                package_files[file_type] = future.result()
+            
             # 4. Создаем инструкцию
             instruction_file = os.path.join(self.ai_export_dir, f"AI_ANALYSIS_GUIDE_{timestamp}.md")
             self._create_analysis_guide(instruction_file, package_files)
@@ -270,7 +378,40 @@ class AIExporter:
         except Exception as e:
             print(f"❌ Ошибка при создании пакета: {e}")
             return package_files
+        
+        finally:
+            _package_cache.reset(cache_token)
+    
+    def _cached(self, key, compute):
+        """Возвращает результат из кэша текущего пакета или вычисляет его"""
+        cache = _package_cache.get()
+        if cache is None:
+            return compute()
+        return cache.get(key, compute)
+    
+    def _get_topics(self, chat_id: int = None, conn: sqlite3.Connection = None) -> Dict:
+        """Анализ тем с переиспользованием в рамках одного пакета"""
+        return self._cached(
+            ('topics', chat_id),
+            lambda: self.analytics.analyze_conversation_topics(chat_id, conn=conn)
+        )
     
+    def _get_active_chats(self, conn: sqlite3.Connection = None) -> List[Dict]:
+        """Топ-10 активных чатов с переиспользованием в рамках одного пакета"""
+        return self._cached(
+            'active_chats',
+            lambda: self.analytics.get_most_active_chats(limit=10, conn=conn)
+        )
+    
+    def _write_json(self, filepath: str, data: Any):
+        """Сериализует данные целиком и записывает файл одним вызовом write"""
+        if orjson is not None:
+            payload = orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        else:
+            payload = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+        with open(filepath, 'wb', buffering=1 << 16) as f:
+            f.write(payload)
+
     def _create_analysis_guide(self, filepath: str, package_files: Dict[str, str]):
         """Создает руководство по анализу"""
         guide_content = f"""# 🤖 Руководство по AI анализу Telegram данных
@@ -1,13 +1,193 @@
 """
 Модуль аналитики для Telegram данных
 """
+import os
 import sqlite3
-from typing import Dict, List, Any
+from contextlib import closing, contextmanager
+from typing import Dict, List, Any, Iterable, Optional, Iterator, Tuple
 from datetime import datetime, timedelta
 import json
 from collections import Counter, defaultdict
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import itemgetter
 import emoji
+from database import FULLTEXT_TOKENIZE, ConnectionPool, connect_db
+
+# Стоп-слова для анализа тем (расширенный список)
+_STOP_WORDS = frozenset({
+    'что', 'как', 'где', 'когда', 'кто', 'это', 'для', 'или',
+    'так', 'уже', 'все', 'еще', 'вот', 'там', 'тут', 'она',
+    'они', 'его', 'ему', 'нее', 'них', 'мне', 'нас', 'вас',
+    'the', 'and', 'you', 'that', 'was', 'for', 'are', 'with',
+    'https', 'http', 'www', 'com', 'org', 'net', 'status',
+    'this', 'they', 'from', 'have', 'been', 'will', 'more',
+    'чем', 'тем', 'том', 'под', 'при', 'без', 'над', 'про'
+})
+
+# Паттерны для текстовых смайликов, объединенные в одно регулярное выражение
+_TEXT_SMILIES = [
+    r':\)', r':\(', r':D', r':P', r':p', r';\)', r':\|',
+    r'=\)', r'=\(', r'=D', r'=P', r'=p', r';\(',
+    r'xD', r'XD', r':o', r':O', r':\*', r'<3',
+    r'\)\)', r'\(\(', r':\/', r':\\',
+    r':-\)', r':-\(', r':-D', r':-P', r':-p', r';\-\)',
+    r':-\|', r':-o', r':-O', r':\-\*'
+]
+_SMILEY_RE = re.compile('|'.join(_TEXT_SMILIES))
+
+# Односимвольные эмодзи: сообщение проверяется посимвольно
+_EMOJI_SET = frozenset(e for e in emoji.EMOJI_DATA if len(e) == 1)
+
+# GLOB-шаблоны для грубого отбора сообщений в SQLite. Эмодзи ниже U+2000
+# перечисляются поштучно, остальные попадают в диапазон от меньшего к большему
+_EMOJI_LOW = ''.join(sorted(e for e in _EMOJI_SET if e < '\u2000'))
+_EMOJI_HIGH = sorted(e for e in _EMOJI_SET if e >= '\u2000')
+_EMOJI_GLOB = (
+    f'*[{_EMOJI_LOW}{_EMOJI_HIGH[0]}-{_EMOJI_HIGH[-1]}]*' if _EMOJI_HIGH
+    else f'*[{_EMOJI_LOW}]*' if _EMOJI_LOW
+    else ''
+)
+# Каждый текстовый смайлик содержит один из этих символов либо "xD"/"XD"
+_SMILEY_GLOBS = ('*[:;=<()]*', '*[xX]D*')
+_SMILEY_SEEDS = frozenset(':;=<()xX')
+
+
+# Сколько разделов отчета по чату считается одновременно
+_REPORT_WORKERS = 4
+
+# Сколько соединений с БД держит один объект аналитики
+_POOL_SIZE = 8
+
+# Сколько сообщений токенизируется за один проход регулярного выражения
+_TOPIC_BATCH_SIZE = 10000
+_first_column = itemgetter(0)
+
+
+# Слова из словаря FTS5 с теми же условиями, что у регулярного выражения:
+# только буквы и минимальная длина, плюс исключение стоп-слов
+_FULLTEXT_WORD_FILTER = '''
+    FROM messages_fts_vocab
+    WHERE length(term) >= ? AND term NOT GLOB '*[^а-яёa-z]*'
+    AND term NOT IN (SELECT value FROM json_each(?))
+'''
+_STOP_WORDS_JSON = json.dumps(sorted(_STOP_WORDS))
+
+
+def _fulltext_word_params(min_word_length: int) -> tuple:
+    """Параметры для _FULLTEXT_WORD_FILTER"""
+    return (min_word_length, _STOP_WORDS_JSON)
+
+
+@lru_cache(maxsize=None)
+def _word_pattern(min_word_length: int) -> re.Pattern:
+    """
+    Регулярное выражение для слов из букв не короче min_word_length.
+    Используется, только если SQLite собран без FTS5: слово учитывается,
+    если состоит целиком из букв [а-яёa-z], части слов вроде "jalapeño"
+    не вырезаются. Таблицы Unicode в Python и SQLite различаются, поэтому
+    на редких символах (комбинируемые знаки, новые эмодзи) возможны расхождения
+    """
+    return re.compile(
+        rf'(?<![^\W0-9_])[а-яёa-z]{{{min_word_length},}}(?![^\W0-9_])'
+    )
+
+
+def _count_batch_words(word_counter: Counter, texts, word_pattern: re.Pattern):
+    """
+    Добавляет в счетчик слова пачки текстов: тексты склеиваются, и регулярное
+    выражение с Counter проходят по ним одним вызовом на C-уровне
+    """
+    word_counter.update(word_pattern.findall('\n'.join(texts).lower()))
+
+
+def _open_word_index() -> Optional[sqlite3.Connection]:
+    """
+    Временный FTS5-индекс в памяти с токенизатором messages_fts, чтобы слова
+    чата считались по тем же правилам, что и словарь индекса всей базы.
+    Возвращает None, если SQLite собран без FTS5
+    """
+    word_index = sqlite3.connect(':memory:')
+    try:
+        word_index.executescript('''
+            CREATE VIRTUAL TABLE messages_fts USING fts5(
+                text, content='', columnsize=0, tokenize="''' + FULLTEXT_TOKENIZE + '''"
+            );
+            CREATE VIRTUAL TABLE messages_fts_vocab USING fts5vocab(messages_fts, 'row');
+        ''')
+    except sqlite3.OperationalError:
+        word_index.close()
+        return None
+    return word_index
+
+
+def _count_texts_words(text_batches: Iterable[List[str]],
+                       min_word_length: int) -> Tuple[int, Counter]:
+    """
+    Считает слова в пачках текстов; возвращает число текстов и частоты
+    без стоп-слов. Тексты токенизируются FTS5 в памяти и фильтруются
+    _FULLTEXT_WORD_FILTER, как в _topics_from_fulltext_index
+    """
+    total_texts = 0
+    word_index = _open_word_index()
+
+    if word_index is None:
+        word_counter = Counter()
+        word_pattern = _word_pattern(min_word_length)
+        for texts in text_batches:
+            total_texts += len(texts)
+            _count_batch_words(word_counter, texts, word_pattern)
+        _drop_stop_words(word_counter)
+        return total_texts, word_counter
+
+    with closing(word_index):
+        for texts in text_batches:
+            word_index.executemany(
+                'INSERT INTO messages_fts(rowid, text) VALUES (?, ?)',
+                enumerate(texts, total_texts + 1)
+            )
+            total_texts += len(texts)
+        # Словарь отдается по алфавиту: при равных частотах порядок слов
+        # совпадает с ORDER BY cnt DESC, term в _topics_from_fulltext_index
+        word_counter = Counter(dict(word_index.execute(
+            f'SELECT term, cnt {_FULLTEXT_WORD_FILTER}', _fulltext_word_params(min_word_length)
+        )))
+    return total_texts, word_counter
+
+
+def _drop_stop_words(word_counter: Counter):
+    """Убирает стоп-слова из посчитанных частот"""
+    for stop_word in _STOP_WORDS:
+        word_counter.pop(stop_word, None)
+
+
+def _topics_result(total_messages: int, word_counter: Counter, top_n: int) -> Dict:
+    """Результат анализа тем по посчитанным частотам слов"""
+    return {
+        'total_messages_analyzed': total_messages,
+        'unique_words': len(word_counter),
+        'top_words': [{'word': word, 'count': count}
+                      for word, count in word_counter.most_common(top_n)]
+    }
+
+
+def _reset_read_connection(conn: sqlite3.Connection):
+    """
+    Соединение возвращается в пул: завершаем читающую транзакцию
+    и сбрасываем настройки, выставленные методом
+    """
+    if conn.in_transaction:
+        conn.rollback()
+    conn.row_factory = None
+
+
+def _rows_to_dicts(cursor: sqlite3.Cursor) -> List[Dict]:
+    """Превращает строки курсора в словари, получая имена колонок один раз"""
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
 
 class TelegramAnalytics:
     """
@@ -16,8 +196,91 @@ class TelegramAnalytics:
 
     def __init__(self, db_path: str):
         self.db_path = db_path
+        # Ограниченный пул долгоживущих соединений: PRAGMA применяются один раз,
+        # а число соединений не растет с числом потоков веб-сервера
+        self._pool = ConnectionPool(
+            lambda: connect_db(self.db_path, check_same_thread=False, read_only=True),
+            _POOL_SIZE, reset=_reset_read_connection
+        )
+        self._executor_lock = threading.Lock()
+        self._executor = None
+        # Кэш разделов отчета по чату, действует пока не изменилась база
+        self._report_cache = {}
+        self._report_cache_version = None
+        self._report_cache_lock = threading.Lock()
+
+    def _report_executor(self) -> ThreadPoolExecutor:
+        """Пул потоков для разделов отчета; создается при первом отчете"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=_REPORT_WORKERS, thread_name_prefix='analytics'
+                )
+            return self._executor
+
+    def close(self):
+        """Останавливает пул потоков и закрывает все открытые соединения аналитики"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+        self._pool.close()
+
+    def _data_version(self) -> tuple:
+        """
+        Версия данных базы: время изменения и размер файла БД и WAL-журнала.
+        В режиме WAL запись сначала попадает в журнал, поэтому учитываются оба файла
+        """
+        version = []
+        for path in (self.db_path, self.db_path + '-wal'):
+            try:
+                stat = os.stat(path)
+                version.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                version.append(None)
+        return tuple(version)
+
+    def invalidate_cache(self):
+        """Сбрасывает кэш разделов отчетов (например, после загрузки новых сообщений)"""
+        with self._report_cache_lock:
+            self._report_cache.clear()
+            self._report_cache_version = None
+
+    def _cached_section(self, name: str, chat_id: int, compute):
+        """Возвращает раздел отчета из кэша или вычисляет его для текущей версии базы"""
+        version = self._data_version()
+        key = (name, chat_id)
+
+        with self._report_cache_lock:
+            if version != self._report_cache_version:
+                self._report_cache.clear()
+                self._report_cache_version = version
+            elif key in self._report_cache:
+                return self._report_cache[key]
+
+        result = compute()
+
+        with self._report_cache_lock:
+            if version == self._report_cache_version:
+                self._report_cache[key] = result
+        return result
+
+    @contextmanager
+    def _connection(self, conn: Optional[sqlite3.Connection] = None):
+        """
+        Отдает переданное соединение или соединение из пула,
+        чтобы несколько запросов могли работать через одно подключение
+        """
+        if conn is not None:
+            yield conn
+            return
+
+        with self._pool.connection() as pooled_conn:
+            yield pooled_conn
 
-    def get_most_active_chats(self, limit: int = 10, days: int = None) -> List[Dict]:
+    def get_most_active_chats(self, limit: int = 10, days: int = None,
+                              conn: Optional[sqlite3.Connection] = None) -> List[Dict]:
         """
         Находит самые активные чаты
 
@@ -25,14 +288,13 @@ class TelegramAnalytics:
             limit: Количество чатов в результате
             days: Период в днях (None = все время)
         """
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-
+        with self._connection(conn) as conn:
             date_filter = ""
             params = []
 
             if days:
-                date_filter = "AND m.date > datetime('now', '-{} days')".format(days)
+                date_filter = "AND m.date > datetime('now', ?)"
+                params.append(f'-{int(days)} days')
 
             query = f'''
                 SELECT
@@ -47,115 +309,164 @@ class TelegramAnalytics:
                     ROUND(AVG(LENGTH(m.text)), 2) as avg_message_length
                 FROM chats c
                 JOIN messages m ON c.id = m.chat_id
-                WHERE m.is_deleted = FALSE {date_filter}
+                WHERE m.is_deleted = 0 {date_filter}
                 GROUP BY c.id, c.name, c.type
                 ORDER BY message_count DESC
                 LIMIT ?
             '''
 
             params.append(limit)
-            results = conn.execute(query, params).fetchall()
+            return _rows_to_dicts(conn.execute(query, params))
 
-            return [dict(row) for row in results]
-
-    def get_activity_by_time(self, chat_id: int = None) -> Dict:
+    def get_activity_by_time(self, chat_id: int = None,
+                             conn: Optional[sqlite3.Connection] = None) -> Dict:
         """
         Анализирует активность по времени (часы, дни недели)
         """
-        with sqlite3.connect(self.db_path) as conn:
-            chat_filter = f"AND chat_id = {chat_id}" if chat_id else ""
-
-            # Активность по часам
-            hours_query = f'''
-                SELECT
-                    strftime('%H', date) as hour,
-                    COUNT(*) as message_count
-                FROM messages
-                WHERE is_deleted = FALSE {chat_filter}
-                GROUP BY hour
-                ORDER BY hour
-            '''
+        with self._connection(conn) as conn:
+            chat_filter = "AND chat_id = ?" if chat_id else ""
+            params = [chat_id] if chat_id else []
 
-            # Активность по дням недели (0=воскресенье, 6=суббота)
-            weekdays_query = f'''
+            # Активность по часам и дням недели (0=воскресенье, 6=суббота)
+            # за один проход: не больше 7 * 24 групп
+            activity_data = conn.execute(f'''
                 SELECT
                     strftime('%w', date) as weekday,
+                    strftime('%H', date) as hour,
                     COUNT(*) as message_count
                 FROM messages
-                WHERE is_deleted = FALSE {chat_filter}
-                GROUP BY weekday
-                ORDER BY weekday
-            '''
+                WHERE is_deleted = 0 {chat_filter}
+                GROUP BY weekday, hour
+            ''', params).fetchall()
 
-            hours_data = conn.execute(hours_query).fetchall()
-            weekdays_data = conn.execute(weekdays_query).fetchall()
+            by_hour = Counter()
+            by_weekday = Counter()
+            for weekday, hour, count in activity_data:
+                by_hour[int(hour)] += count
+                by_weekday[int(weekday)] += count
 
             # Преобразуем дни недели в названия
             weekday_names = ['Воскресенье', 'Понедельник', 'Вторник', 'Среда',
                            'Четверг', 'Пятница', 'Суббота']
 
             return {
-                'by_hour': [{'hour': int(h), 'count': c} for h, c in hours_data],
+                'by_hour': [{'hour': h, 'count': c} for h, c in sorted(by_hour.items())],
                 'by_weekday': [
-                    {'weekday': weekday_names[int(w)], 'count': c}
-                    for w, c in weekdays_data
+                    {'weekday': weekday_names[w], 'count': c}
+                    for w, c in sorted(by_weekday.items())
                 ]
             }
 
-    def analyze_conversation_topics(self, chat_id: int = None, min_word_length: int = 4) -> Dict:
+    def analyze_conversation_topics(self, chat_id: int = None, min_word_length: int = 4,
+                                    conn: Optional[sqlite3.Connection] = None,
+                                    top_n: int = 50) -> Dict:
         """
         Анализирует темы разговоров через частотность слов
-        """
-        with sqlite3.connect(self.db_path) as conn:
-            chat_filter = f"AND chat_id = {chat_id}" if chat_id else ""
-
-            messages = conn.execute(f'''
-                SELECT text FROM messages
-                WHERE is_deleted = FALSE AND text IS NOT NULL
-                AND LENGTH(text) > 10 {chat_filter}
-            ''').fetchall()
-
-            # Обработка текста
-            word_counter = Counter()
-            total_messages = len(messages)
-
-            # Стоп-слова (расширенный список)
-            stop_words = {'что', 'как', 'где', 'когда', 'кто', 'это', 'для', 'или',
-                         'так', 'уже', 'все', 'еще', 'вот', 'там', 'тут', 'она',
-                         'они', 'его', 'ему', 'нее', 'них', 'мне', 'нас', 'вас',
-                         'the', 'and', 'you', 'that', 'was', 'for', 'are', 'with',
-                         'https', 'http', 'www', 'com', 'org', 'net', 'status',
-                         'this', 'they', 'from', 'have', 'been', 'will', 'more',
-                         'чем', 'тем', 'том', 'под', 'при', 'без', 'над', 'про'}
 
-            for (text,) in messages:
-                if text:
-                    # Извлекаем слова (только буквы, минимум нужной длины)
-                    words = re.findall(r'[а-яёa-z]+', text.lower())
-
-                    # Фильтруем по длине и стоп-словам
-                    filtered_words = [w for w in words
-                                    if len(w) >= min_word_length and w not in stop_words]
-                    word_counter.update(filtered_words)
+        Args:
+            top_n: Сколько самых частых слов вернуть в top_words
+        """
+        with self._connection(conn) as conn:
+            if not chat_id and self._has_fulltext_index(conn):
+                return self._topics_from_fulltext_index(conn, min_word_length, top_n)
 
-            # Топ слов
-            top_words = word_counter.most_common(50)
+            total_messages, word_counter = self._count_words(conn, chat_id, min_word_length)
+            return _topics_result(total_messages, word_counter, top_n)
 
-            return {
-                'total_messages_analyzed': total_messages,
-                'unique_words': len(word_counter),
-                'top_words': [{'word': word, 'count': count} for word, count in top_words],
-                'word_frequency': dict(word_counter)
-            }
+    @staticmethod
+    def analyze_conversation_topics_from_texts(texts: List[str], min_word_length: int = 4,
+                                               top_n: int = 50) -> Dict:
+        """
+        Анализ тем по уже загруженным текстам, без обращения к базе.
+        Формат результата такой же, как у analyze_conversation_topics
+        """
+        total_texts, word_counter = _count_texts_words([list(texts)], min_word_length)
+        return _topics_result(total_texts, word_counter, top_n)
 
-    def get_user_statistics(self, chat_id: int = None) -> List[Dict]:
+    def iter_word_frequencies(self, chat_id: int = None,
+                              min_word_length: int = 4) -> Iterator[Tuple[str, int]]:
+        """
+        Выдает пары (слово, количество) для всех слов, учитываемых анализом тем,
+        не собирая полный словарь частот в результат анализа.
+        Итератор нужно дочитать до конца или закрыть (close()): до этого
+        он занимает соединение из пула
+        """
+        with self._connection() as conn:
+            if not chat_id and self._has_fulltext_index(conn):
+                yield from conn.execute(
+                    f'SELECT term, cnt {_FULLTEXT_WORD_FILTER}',
+                    _fulltext_word_params(min_word_length)
+                )
+                return
+
+            _, word_counter = self._count_words(conn, chat_id, min_word_length)
+            yield from word_counter.items()
+
+    @staticmethod
+    def _count_words(conn: sqlite3.Connection, chat_id: Optional[int],
+                     min_word_length: int) -> Tuple[int, Counter]:
+        """Считает слова сообщений чата; возвращает число сообщений и частоты"""
+        chat_filter = "AND chat_id = ?" if chat_id else ""
+        params = [chat_id] if chat_id else []
+
+        cursor = conn.execute(f'''
+            SELECT text FROM messages
+            WHERE is_deleted = 0 AND text IS NOT NULL
+            AND LENGTH(text) > 10 {chat_filter}
+        ''', params)
+
+        # Тексты передаются на подсчет пачками по мере чтения курсора
+        def text_batches():
+            while True:
+                rows = cursor.fetchmany(_TOPIC_BATCH_SIZE)
+                if not rows:
+                    return
+                yield list(map(_first_column, rows))
+
+        return _count_texts_words(text_batches(), min_word_length)
+
+    @staticmethod
+    def _has_fulltext_index(conn: sqlite3.Connection) -> bool:
+        """Проверяет, создан ли в базе FTS5-словарь сообщений"""
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts_vocab'"
+        ).fetchone() is not None
+
+    @staticmethod
+    def _topics_from_fulltext_index(conn: sqlite3.Connection, min_word_length: int,
+                                    top_n: int) -> Dict:
+        """
+        Частотность слов по всем чатам из словаря FTS5: токенизация и подсчет
+        уже выполнены SQLite при индексации, сюда приходят только итоговые слова
+        """
+        params = _fulltext_word_params(min_word_length)
+
+        total_messages = conn.execute('''
+            SELECT COUNT(*) FROM messages
+            WHERE is_deleted = 0 AND text IS NOT NULL AND LENGTH(text) > 10
+        ''').fetchone()[0]
+        unique_words = conn.execute(
+            f'SELECT COUNT(*) {_FULLTEXT_WORD_FILTER}', params
+        ).fetchone()[0]
+        top_words = conn.execute(
+            f'SELECT term, cnt {_FULLTEXT_WORD_FILTER} ORDER BY cnt DESC, term LIMIT ?',
+            params + (top_n,)
+        ).fetchall()
+
+        return {
+            'total_messages_analyzed': total_messages,
+            'unique_words': unique_words,
+            'top_words': [{'word': word, 'count': count} for word, count in top_words]
+        }
+
+    def get_user_statistics(self, chat_id: int = None,
+                            conn: Optional[sqlite3.Connection] = None) -> List[Dict]:
         """
         Статистика по пользователям
         """
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-
-            chat_filter = f"AND m.chat_id = {chat_id}" if chat_id else ""
+        with self._connection(conn) as conn:
+            chat_filter = "AND m.chat_id = ?" if chat_id else ""
+            params = [chat_id] if chat_id else []
 
             query = f'''
                 SELECT
@@ -169,21 +480,19 @@ class TelegramAnalytics:
                     COUNT(CASE WHEN m.media_type IS NOT NULL THEN 1 END) as media_messages
                 FROM users u
                 JOIN messages m ON u.id = m.sender_id
-                WHERE m.is_deleted = FALSE {chat_filter}
+                WHERE m.is_deleted = 0 {chat_filter}
                 GROUP BY u.id, u.first_name, u.last_name, u.username
                 ORDER BY message_count DESC
             '''
 
-            results = conn.execute(query).fetchall()
-            return [dict(row) for row in results]
+            return _rows_to_dicts(conn.execute(query, params))
 
-    def get_message_changes_analytics(self, chat_id: int = None) -> Dict:
+    def get_message_changes_analytics(self, chat_id: int = None,
+                                      conn: Optional[sqlite3.Connection] = None) -> Dict:
         """
         Анализ изменений сообщений (редактирования, удаления)
         """
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            
+        with self._connection(conn) as conn:
             # Фильтр для конкретного чата
             chat_filter = ""
             params = []
@@ -191,79 +500,126 @@ class TelegramAnalytics:
                 chat_filter = "WHERE chat_id = ?"
                 params = [chat_id]
 
-            # Общая статистика изменений
-            changes_stats = conn.execute(f'''
-                SELECT
-                    action_type,
-                    COUNT(*) as count,
-                    COUNT(DISTINCT chat_id) as affected_chats,
-                    COUNT(DISTINCT message_id) as affected_messages
-                FROM message_history
-                {chat_filter}
-                GROUP BY action_type
-            ''', params).fetchall()
-
-            # Чаты с наибольшим количеством изменений
+            # Чаты с наибольшим количеством изменений; для конкретного чата
+            # вместо этого показываем статистику по дням
             if chat_id:
-                # Для конкретного чата показываем статистику по дням
-                most_edited_chats = conn.execute('''
+                top_label, top_limit = 'date', 30
+                top_query = '''
                     SELECT
-                        DATE(timestamp) as date,
+                        day as label,
                         COUNT(*) as total_changes,
                         COUNT(CASE WHEN action_type = 'edited' THEN 1 END) as edits,
-                        COUNT(CASE WHEN action_type = 'deleted' THEN 1 END) as deletions
-                    FROM message_history
-                    WHERE chat_id = ?
-                    GROUP BY DATE(timestamp)
-                    ORDER BY date DESC
-                    LIMIT 30
-                ''', [chat_id]).fetchall()
+                        COUNT(CASE WHEN action_type = 'deleted' THEN 1 END) as deletions,
+                        ROW_NUMBER() OVER (ORDER BY day DESC) as seq
+                    FROM mh
+                    GROUP BY day
+                '''
             else:
-                most_edited_chats = conn.execute('''
+                top_label, top_limit = 'chat_name', 10
+                top_query = '''
                     SELECT
-                        c.name as chat_name,
-                        COUNT(mh.id) as total_changes,
+                        c.name as label,
+                        COUNT(*) as total_changes,
                         COUNT(CASE WHEN mh.action_type = 'edited' THEN 1 END) as edits,
-                        COUNT(CASE WHEN mh.action_type = 'deleted' THEN 1 END) as deletions
-                    FROM message_history mh
+                        COUNT(CASE WHEN mh.action_type = 'deleted' THEN 1 END) as deletions,
+                        ROW_NUMBER() OVER (ORDER BY COUNT(*) DESC) as seq
+                    FROM mh
                     JOIN chats c ON mh.chat_id = c.id
                     GROUP BY c.id, c.name
-                    ORDER BY total_changes DESC
-                    LIMIT 10
-                ''').fetchall()
+                '''
 
-            # Активность изменений по времени (последние 30 дней)
-            recent_changes_query = f'''
-                SELECT
-                    DATE(timestamp) as date,
-                    action_type,
-                    COUNT(*) as count
-                FROM message_history
-                {chat_filter}
-                {"AND" if chat_filter else "WHERE"} timestamp > datetime('now', '-30 days')
-                GROUP BY DATE(timestamp), action_type
-                ORDER BY date DESC
-            '''
-            recent_changes = conn.execute(recent_changes_query, params).fetchall()
+            # Все три раздела считаются за один проход по message_history:
+            # узкая выборка mh используется трижды, поэтому SQLite
+            # материализует ее один раз, а строки разделов различает kind
+            rows = conn.execute(f'''
+                WITH mh AS (
+                    SELECT
+                        chat_id,
+                        message_id,
+                        action_type,
+                        DATE(timestamp) as day,
+                        timestamp > datetime('now', '-30 days') as is_recent
+                    FROM message_history
+                    {chat_filter}
+                ),
+                summary AS (
+                    SELECT
+                        action_type,
+                        COUNT(*) as count,
+                        COUNT(DISTINCT chat_id) as affected_chats,
+                        COUNT(DISTINCT message_id) as affected_messages,
+                        ROW_NUMBER() OVER (ORDER BY action_type) as seq
+                    FROM mh
+                    GROUP BY action_type
+                ),
+                top AS ({top_query}),
+                recent AS (
+                    SELECT
+                        day,
+                        action_type,
+                        COUNT(*) as count,
+                        ROW_NUMBER() OVER (ORDER BY day DESC, action_type) as seq
+                    FROM mh
+                    WHERE is_recent
+                    GROUP BY day, action_type
+                )
+                SELECT 0, seq, action_type, NULL, count, affected_chats, affected_messages
+                FROM summary
+                UNION ALL
+                SELECT 1, seq, label, NULL, total_changes, edits, deletions
+                FROM top WHERE seq <= ?
+                UNION ALL
+                SELECT 2, seq, day, action_type, count, NULL, NULL
+                FROM recent
+                ORDER BY 1, 2
+            ''', params + [top_limit])
+
+            changes_stats = []
+            most_edited_chats = []
+            recent_changes = []
+
+            for kind, _, key, action_type, count, second, third in rows:
+                if kind == 0:
+                    # Общая статистика изменений
+                    changes_stats.append({
+                        'action_type': key,
+                        'count': count,
+                        'affected_chats': second,
+                        'affected_messages': third
+                    })
+                elif kind == 1:
+                    most_edited_chats.append({
+                        top_label: key,
+                        'total_changes': count,
+                        'edits': second,
+                        'deletions': third
+                    })
+                else:
+                    # Активность изменений по времени (последние 30 дней)
+                    recent_changes.append({
+                        'date': key,
+                        'action_type': action_type,
+                        'count': count
+                    })
 
             return {
-                'changes_summary': [dict(row) for row in changes_stats],
-                'most_active_chats': [dict(row) for row in most_edited_chats],
-                'recent_activity': [dict(row) for row in recent_changes]
+                'changes_summary': changes_stats,
+                'most_active_chats': most_edited_chats,
+                'recent_activity': recent_changes
             }
     
     def get_all_chats(self) -> List[Dict]:
         """
         Получает список всех чатов
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             conn.row_factory = sqlite3.Row
             chats = conn.execute('''
                 SELECT 
                     c.id as chat_id,
                     c.name as chat_name,
                     c.type as chat_type,
-                    COUNT(DISTINCT m.id) as message_count
+                    COUNT(m.id) as message_count
                 FROM chats c
                 LEFT JOIN messages m ON c.id = m.chat_id
                 GROUP BY c.id
@@ -272,24 +628,26 @@ class TelegramAnalytics:
             
             return [dict(chat) for chat in chats]
     
-    def get_chat_changes_count(self, chat_id: int) -> int:
+    def get_chat_changes_count(self, chat_id: int,
+                               conn: Optional[sqlite3.Connection] = None) -> int:
         """
         Получает количество изменений для конкретного чата
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection(conn) as conn:
             result = conn.execute('''
                 SELECT COUNT(*) as count
                 FROM message_history
                 WHERE chat_id = ?
             ''', (chat_id,)).fetchone()
             
-            return result['count'] if result else 0
+            return result[0] if result else 0
 
-    def get_chat_statistics(self, chat_id: int) -> Dict:
+    def get_chat_statistics(self, chat_id: int,
+                            conn: Optional[sqlite3.Connection] = None) -> Dict:
         """
         Получает статистику для конкретного чата
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection(conn) as conn:
             conn.row_factory = sqlite3.Row
             
             stats = conn.execute('''
@@ -304,7 +662,7 @@ class TelegramAnalytics:
                     MAX(m.date) as last_message,
                     ROUND(AVG(LENGTH(m.text)), 2) as avg_message_length
                 FROM chats c
-                LEFT JOIN messages m ON c.id = m.chat_id AND m.is_deleted = FALSE
+                LEFT JOIN messages m ON c.id = m.chat_id AND m.is_deleted = 0
                 WHERE c.id = ?
                 GROUP BY c.id
             ''', (chat_id,)).fetchone()
@@ -315,40 +673,61 @@ class TelegramAnalytics:
         """
         Генерирует полный отчет по чату
         """
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-
-            # Базовая информация о чате
-            chat_info = conn.execute('''
-                SELECT name, type FROM chats WHERE id = ?
-            ''', (chat_id,)).fetchone()
-
-            if not chat_info:
-                return {'error': 'Chat not found'}
-
-            # Собираем все данные
-            report = {
-                'chat_info': dict(chat_info),
-                'chat_id': chat_id,
-                'generated_at': datetime.now().isoformat(),
-                'activity_stats': self.get_chat_statistics(chat_id),
-                'time_analysis': self.get_activity_by_time(chat_id),
-                'topic_analysis': self.analyze_conversation_topics(chat_id),
-                'user_stats': self.get_user_statistics(chat_id),
-                'changes_analytics': self.get_message_changes_analytics(chat_id),
-                'changes_count': self.get_chat_changes_count(chat_id)
-            }
-
-            return report
-
-    def generate_ai_friendly_summary(self, chat_id: int = None, max_messages: int = 100) -> Dict:
+        def section(name, method):
+            return self._cached_section(name, chat_id, lambda: method(chat_id))
+
+        # Статистика чата заодно содержит его название и тип
+        activity_stats = section('chat_statistics', self.get_chat_statistics)
+
+        if not activity_stats:
+            return {'error': 'Chat not found'}
+
+        # Остальные разделы независимы и только читают базу, поэтому
+        # считаются параллельно: у каждого потока свое соединение, WAL
+        # допускает одновременных читателей, а SQLite отпускает GIL на время запроса
+        executor = self._report_executor()
+        futures = {
+            key: executor.submit(section, name, method)
+            for key, name, method in (
+                ('time_analysis', 'activity_by_time', self.get_activity_by_time),
+                ('topic_analysis', 'topics', self.analyze_conversation_topics),
+                ('user_stats', 'user_statistics', self.get_user_statistics),
+                ('changes_analytics', 'changes_analytics', self.get_message_changes_analytics),
+                ('changes_count', 'changes_count', self.get_chat_changes_count)
+            )
+        }
+
+        # Собираем все данные
+        report = {
+            'chat_info': {
+                'name': activity_stats['chat_name'],
+                'type': activity_stats['chat_type']
+            },
+            'chat_id': chat_id,
+            'generated_at': datetime.now().isoformat(),
+            'activity_stats': activity_stats
+        }
+        for key, future in futures.items():
+            report[key] = future.result()
+
+        return report
+
+    def generate_ai_friendly_summary(self, chat_id: int = None, max_messages: int = 100,
+                                     conn: Optional[sqlite3.Connection] = None,
+                                     topics: Dict = None,
+                                     active_chats: List[Dict] = None) -> Dict:
         """
         Создает сводку, оптимизированную для анализа ИИ
+
+        Args:
+            topics: Готовый результат analyze_conversation_topics (чтобы не считать повторно)
+            active_chats: Готовый список активных чатов для контекста
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection(conn) as conn:
             conn.row_factory = sqlite3.Row
 
-            chat_filter = f"AND m.chat_id = {chat_id}" if chat_id else ""
+            chat_filter = "AND m.chat_id = ?" if chat_id else ""
+            params = [chat_id] if chat_id else []
 
             # Получаем недавние сообщения
             recent_messages = conn.execute(f'''
@@ -361,16 +740,23 @@ class TelegramAnalytics:
                 FROM messages m
                 LEFT JOIN users u ON m.sender_id = u.id
                 LEFT JOIN chats c ON m.chat_id = c.id
-                WHERE m.is_deleted = FALSE
+                WHERE m.is_deleted = 0
                 AND m.text IS NOT NULL
                 AND LENGTH(m.text) > 5 {chat_filter}
                 ORDER BY m.date DESC
                 LIMIT ?
-            ''', (max_messages,)).fetchall()
+            ''', params + [max_messages]).fetchall()
 
-            # Статистика для контекста
-            stats = self.get_most_active_chats(limit=5)
-            topics = self.analyze_conversation_topics(chat_id)
+            # Контекст сводки - недавние сообщения: активность чатов за неделю
+            # и темы по уже загруженным текстам, без прохода по всей истории
+            if active_chats is not None:
+                stats = active_chats
+            else:
+                stats = self.get_most_active_chats(limit=5, days=7, conn=conn)
+            if topics is None:
+                topics = self.analyze_conversation_topics_from_texts(
+                    [msg['text'] for msg in recent_messages], top_n=20
+                )
 
             return {
                 'summary_type': 'ai_analysis_ready',
@@ -403,59 +789,75 @@ class TelegramAnalytics:
         """
         Анализирует кто чаще всего начинает диалоги
         """
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self._connection() as conn:
+            chat_filter = "AND m.chat_id = ?" if chat_id else ""
+            params = [chat_id] if chat_id else []
 
-            chat_filter = f"AND m.chat_id = {chat_id}" if chat_id else ""
-
-            # Получаем сообщения отсортированные по времени
-            messages = conn.execute(f'''
-                SELECT
-                    m.sender_id,
-                    m.date,
-                    m.text,
-                    COALESCE(u.first_name, u.username, 'User_' || u.id) as sender_name
+            message_filter = f'''
                 FROM messages m
-                LEFT JOIN users u ON m.sender_id = u.id
-                WHERE m.is_deleted = FALSE
+                WHERE m.is_deleted = 0
                 AND m.text IS NOT NULL
                 AND LENGTH(m.text) > 0 {chat_filter}
-                ORDER BY m.date ASC
-            ''').fetchall()
+            '''
 
-            if not messages:
+            # Границы периода и его длительность в секундах считает SQLite
+            first_date, last_date, total_messages, period_seconds = conn.execute(f'''
+                SELECT
+                    MIN(m.date),
+                    MAX(m.date),
+                    COUNT(*),
+                    strftime('%s', MAX(m.date)) - strftime('%s', MIN(m.date))
+                {message_filter}
+            ''', params).fetchone()
+
+            if not total_messages:
                 return {'error': 'Нет сообщений для анализа'}
 
-            # Анализируем инициацию диалогов
-            conversation_starters = Counter()
-            last_sender = None
-            conversation_gaps = []  # Промежутки между сообщениями
-
-            for i, msg in enumerate(messages):
-                current_time = datetime.fromisoformat(msg['date'])
-
-                # Если это первое сообщение или прошло много времени с последнего
-                if i == 0:
-                    conversation_starters[msg['sender_id']] += 1
-                    last_sender = msg['sender_id']
-                    continue
-
-                prev_time = datetime.fromisoformat(messages[i-1]['date'])
-                time_gap = (current_time - prev_time).total_seconds() / 3600  # в часах
-
-                # Если прошло больше 2 часов - считаем новым диалогом
-                if time_gap > 2 or msg['sender_id'] != last_sender:
-                    conversation_starters[msg['sender_id']] += 1
-
-                last_sender = msg['sender_id']
-                conversation_gaps.append(time_gap)
+            # Начало диалога: первое сообщение, смена автора или пауза больше 2 часов.
+            # Сравнение с предыдущим сообщением и подсчет выполняет SQLite,
+            # в Python возвращается по строке на пользователя
+            starters = conn.execute(f'''
+                WITH ordered AS (
+                    SELECT
+                        m.sender_id,
+                        m.date,
+                        LAG(m.date) OVER w as prev_date,
+                        LAG(m.sender_id) OVER w as prev_sender
+                    {message_filter}
+                    WINDOW w AS (ORDER BY m.date)
+                ),
+                flagged AS (
+                    SELECT
+                        sender_id,
+                        date,
+                        (prev_date IS NULL
+                         OR strftime('%s', date) - strftime('%s', prev_date) > 7200
+                         OR sender_id IS NOT prev_sender) as is_start
+                    FROM ordered
+                ),
+                counts AS (
+                    SELECT
+                        sender_id,
+                        SUM(is_start) as starts,
+                        MIN(CASE WHEN is_start THEN date END) as first_start
+                    FROM flagged
+                    GROUP BY sender_id
+                    HAVING starts > 0
+                )
+                SELECT
+                    counts.sender_id,
+                    COALESCE(u.first_name, u.username, 'User_' || u.id) as sender_name,
+                    counts.starts
+                FROM counts
+                LEFT JOIN users u ON counts.sender_id = u.id
+                ORDER BY counts.starts DESC, counts.first_start
+            ''', params).fetchall()
 
             # Статистика по пользователям
-            total_conversations = sum(conversation_starters.values())
+            total_conversations = sum(starts for _, _, starts in starters)
             starter_stats = []
 
-            for sender_id, count in conversation_starters.most_common():
-                sender_name = next((msg['sender_name'] for msg in messages if msg['sender_id'] == sender_id), f'User_{sender_id}')
+            for sender_id, sender_name, count in starters:
                 percentage = (count / total_conversations) * 100
                 starter_stats.append({
                     'sender_id': sender_id,
@@ -464,14 +866,22 @@ class TelegramAnalytics:
                     'percentage': round(percentage, 1)
                 })
 
+            # Сумма промежутков между соседними сообщениями равна
+            # времени от первого до последнего, промежутков на один меньше
+            gaps_count = total_messages - 1
+            if gaps_count:
+                average_gap = round(period_seconds / 3600 / gaps_count, 2)
+            else:
+                average_gap = 0
+
             return {
                 'total_conversations': total_conversations,
                 'conversation_starters': starter_stats,
-                'average_gap_hours': round(sum(conversation_gaps) / len(conversation_gaps), 2) if conversation_gaps else 0,
+                'average_gap_hours': average_gap,
                 'analysis_period': {
-                    'from': messages[0]['date'] if messages else None,
-                    'to': messages[-1]['date'] if messages else None,
-                    'total_messages': len(messages)
+                    'from': first_date,
+                    'to': last_date,
+                    'total_messages': total_messages
                 }
             }
 
@@ -479,109 +889,100 @@ class TelegramAnalytics:
         """
         Анализирует использование эмодзи, гифок и текстовых смайликов
         """
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self._connection() as conn:
+            chat_filter = "AND m.chat_id = ?" if chat_id else ""
+            params = [chat_id] if chat_id else []
 
-            chat_filter = f"AND m.chat_id = {chat_id}" if chat_id else ""
-
-            # Получаем сообщения с текстом
-            messages = conn.execute(f'''
-                SELECT
-                    m.sender_id,
-                    m.text,
-                    m.media_type,
-                    COALESCE(u.first_name, u.username, 'User_' || u.id) as sender_name
+            message_filter = f'''
                 FROM messages m
                 LEFT JOIN users u ON m.sender_id = u.id
-                WHERE m.is_deleted = FALSE
+                WHERE m.is_deleted = 0
                 AND m.text IS NOT NULL {chat_filter}
-            ''').fetchall()
+            '''
 
-            # Паттерны для текстовых смайликов
-            text_smilies = [
-                r':\)', r':\(', r':D', r':P', r':p', r';\)', r':\|',
-                r'=\)', r'=\(', r'=D', r'=P', r'=p', r';\(',
-                r'xD', r'XD', r':o', r':O', r':\*', r'<3',
-                r'\)\)', r'\(\(', r':\/', r':\\', r':\|',
-                r':-\)', r':-\(', r':-D', r':-P', r':-p', r';\-\)',
-                r':-\|', r':-o', r':-O', r':\-\*'
-            ]
+            # Количество сообщений и гифок/стикеров по пользователям считает SQLite
+            user_totals = conn.execute(f'''
+                SELECT
+                    m.sender_id,
+                    COALESCE(u.first_name, u.username, 'User_' || u.id) as sender_name,
+                    COUNT(*) as total_messages,
+                    COUNT(CASE WHEN m.media_type LIKE '%gif%'
+                               OR m.media_type LIKE '%sticker%' THEN 1 END) as gif_sticker_messages
+                {message_filter}
+                GROUP BY m.sender_id
+                ORDER BY MIN(m.date)
+            ''', params).fetchall()
 
-            # Статистика по пользователям
-            user_stats = defaultdict(lambda: {
-                'total_messages': 0,
-                'emoji_count': 0,
-                'emoji_messages': 0,
-                'text_smilies_count': 0,
-                'text_smilies_messages': 0,
-                'gif_sticker_messages': 0,
-                'unique_emojis': set(),
-                'sender_name': ''
-            })
+            # Статистика по пользователям: отдельный счетчик на каждый
+            # показатель, ключ - sender_id
+            emoji_messages = Counter()
+            emoji_count = Counter()
+            unique_emojis = defaultdict(set)
+            smilies_messages = Counter()
+            smilies_count = Counter()
 
             all_emojis = Counter()
             all_text_smilies = Counter()
 
-            for msg in messages:
-                sender_id = msg['sender_id']
-                text = msg['text'] or ''
-                media_type = msg['media_type'] or ''
-
-                user_stats[sender_id]['total_messages'] += 1
-                user_stats[sender_id]['sender_name'] = msg['sender_name']
+            # В Python читаются только тексты, где GLOB нашел символы,
+            # из которых состоят эмодзи или текстовые смайлики
+            messages = conn.execute(f'''
+                SELECT m.sender_id, m.text
+                {message_filter}
+                AND (m.text GLOB ? OR m.text GLOB ? OR m.text GLOB ?)
+            ''', params + [_EMOJI_GLOB, *_SMILEY_GLOBS])
 
+            for sender_id, text in messages:
                 # Анализ эмодзи
-                emojis_in_msg = [char for char in text if char in emoji.EMOJI_DATA]
-                if emojis_in_msg:
-                    user_stats[sender_id]['emoji_messages'] += 1
-                    user_stats[sender_id]['emoji_count'] += len(emojis_in_msg)
-                    user_stats[sender_id]['unique_emojis'].update(emojis_in_msg)
+                # Пересечение множеств выполняется в C; для сообщений
+                # без эмодзи посимвольный подсчет не запускается
+                if not _EMOJI_SET.isdisjoint(text):
+                    # filter с методом множества перебирает символы без байткода Python
+                    emojis_in_msg = Counter(filter(_EMOJI_SET.__contains__, text))
+                    emoji_messages[sender_id] += 1
+                    emoji_count[sender_id] += emojis_in_msg.total()
+                    unique_emojis[sender_id].update(emojis_in_msg)
                     all_emojis.update(emojis_in_msg)
 
-                # Анализ текстовых смайликов
-                text_smilies_found = []
-                for smiley_pattern in text_smilies:
-                    matches = re.findall(smiley_pattern, text)
-                    text_smilies_found.extend(matches)
+                # Анализ текстовых смайликов: регулярное выражение запускается
+                # только если в тексте есть символ, с которого начинается смайлик
+                if _SMILEY_SEEDS.isdisjoint(text):
+                    continue
+                text_smilies_found = _SMILEY_RE.findall(text)
 
                 if text_smilies_found:
-                    user_stats[sender_id]['text_smilies_messages'] += 1
-                    user_stats[sender_id]['text_smilies_count'] += len(text_smilies_found)
+                    smilies_messages[sender_id] += 1
+                    smilies_count[sender_id] += len(text_smilies_found)
                     all_text_smilies.update(text_smilies_found)
 
-                # Анализ гифок и стикеров
-                if 'gif' in media_type.lower() or 'sticker' in media_type.lower():
-                    user_stats[sender_id]['gif_sticker_messages'] += 1
-
             # Преобразуем в удобный формат
             result_stats = []
-            for sender_id, stats in user_stats.items():
-                if stats['total_messages'] > 0:
-                    emoji_freq = (stats['emoji_messages'] / stats['total_messages']) * 100
-                    text_smiley_freq = (stats['text_smilies_messages'] / stats['total_messages']) * 100
-                    gif_freq = (stats['gif_sticker_messages'] / stats['total_messages']) * 100
-
-                    result_stats.append({
-                        'sender_id': sender_id,
-                        'sender_name': stats['sender_name'],
-                        'total_messages': stats['total_messages'],
-                        'emoji_usage': {
-                            'messages_with_emoji': stats['emoji_messages'],
-                            'total_emoji_count': stats['emoji_count'],
-                            'emoji_frequency_percent': round(emoji_freq, 1),
-                            'unique_emojis_count': len(stats['unique_emojis']),
-                            'avg_emoji_per_message': round(stats['emoji_count'] / stats['total_messages'], 2)
-                        },
-                        'text_smilies_usage': {
-                            'messages_with_smilies': stats['text_smilies_messages'],
-                            'total_smilies_count': stats['text_smilies_count'],
-                            'smilies_frequency_percent': round(text_smiley_freq, 1)
-                        },
-                        'gif_sticker_usage': {
-                            'gif_sticker_messages': stats['gif_sticker_messages'],
-                            'gif_frequency_percent': round(gif_freq, 1)
-                        }
-                    })
+            for sender_id, sender_name, total_messages, gif_messages in user_totals:
+                emoji_freq = (emoji_messages[sender_id] / total_messages) * 100
+                text_smiley_freq = (smilies_messages[sender_id] / total_messages) * 100
+                gif_freq = (gif_messages / total_messages) * 100
+
+                result_stats.append({
+                    'sender_id': sender_id,
+                    'sender_name': sender_name,
+                    'total_messages': total_messages,
+                    'emoji_usage': {
+                        'messages_with_emoji': emoji_messages[sender_id],
+                        'total_emoji_count': emoji_count[sender_id],
+                        'emoji_frequency_percent': round(emoji_freq, 1),
+                        'unique_emojis_count': len(unique_emojis.get(sender_id, ())),
+                        'avg_emoji_per_message': round(emoji_count[sender_id] / total_messages, 2)
+                    },
+                    'text_smilies_usage': {
+                        'messages_with_smilies': smilies_messages[sender_id],
+                        'total_smilies_count': smilies_count[sender_id],
+                        'smilies_frequency_percent': round(text_smiley_freq, 1)
+                    },
+                    'gif_sticker_usage': {
+                        'gif_sticker_messages': gif_messages,
+                        'gif_frequency_percent': round(gif_freq, 1)
+                    }
+                })
 
             # Сортируем по общей частоте использования эмодзи
             result_stats.sort(key=lambda x: x['emoji_usage']['emoji_frequency_percent'], reverse=True)
@@ -592,6 +993,6 @@ class TelegramAnalytics:
                     'most_used_emojis': [{'emoji': e, 'count': c} for e, c in all_emojis.most_common(20)],
                     'most_used_text_smilies': [{'smiley': s, 'count': c} for s, c in all_text_smilies.most_common(10)],
                     'total_unique_emojis': len(all_emojis),
-                    'total_messages_analyzed': sum(stats['total_messages'] for stats in user_stats.values())
+                    'total_messages_analyzed': sum(row[2] for row in user_totals)
                 }
             }
\ No newline at end of file
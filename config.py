@@ -2,6 +2,7 @@
 Конфигурация для Telegram Parser
 """
 import os
+from types import MappingProxyType
 from dotenv import load_dotenv
 
 # Загружаем переменные из .env файла
@@ -38,6 +39,14 @@ EXPORT_FORMATS = {
     'ai_ready': True  # Создавать файлы для AI анализа
 }
 
+# Флаги форматов вычисляются один раз при импорте; словарь замораживаем,
+# чтобы изменение в рантайме не разошлось с флагами
+EXPORT_FORMATS = MappingProxyType(EXPORT_FORMATS)
+EXPORT_JSON = EXPORT_FORMATS.get('json', False)
+EXPORT_CSV = EXPORT_FORMATS.get('csv', False)
+EXPORT_AI_READY = EXPORT_FORMATS.get('ai_ready', False)
+EXPORT_COMPRESS = False  # Сжимать JSON экспорт в .json.zst (нужен пакет zstandard)
+
 # Настройки автоматизации
 AUTO_CREATE_AI_ANALYSIS = False  # Автоматически создавать AI анализ после парсинга (отключено)
 
@@ -4,11 +4,17 @@
 import json
 import csv
 import os
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, List
+from operator import itemgetter
+from typing import Dict, Any, List, Tuple
 import config
-from json_utils import safe_json_dumps
+from json_utils import safe_json_dumps_bytes
+
+try:
+    import zstandard
+except ImportError:  # zstandard опционален, без него JSON пишется без сжатия
+    zstandard = None
 
 class DataExporter:
     """
@@ -33,8 +39,19 @@ class DataExporter:
         filepath = os.path.join(config.OUTPUT_DIR, filename)
         
         print(f"💾 Сохраняем данные в JSON: {filename}")
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(safe_json_dumps(data))
+        payload = safe_json_dumps_bytes(data)
+        
+        if config.EXPORT_COMPRESS and zstandard is not None:
+            # Уровень 3 сжимает быстрее, чем пишется несжатый файл
+            filepath += '.zst'
+            compressor = zstandard.ZstdCompressor(level=3, threads=-1)
+            with open(filepath, 'wb') as f, compressor.stream_writer(f) as writer:
+                writer.write(payload)
+        else:
+            if config.EXPORT_COMPRESS:
+                print("⚠️ Пакет zstandard не установлен, JSON сохраняется без сжатия")
+            with open(filepath, 'wb') as f:
+                f.write(payload)
         
         print(f"✅ JSON файл сохранен: {filepath}")
         return filepath
@@ -51,28 +68,62 @@ class DataExporter:
         
         print(f"📊 Создаем CSV файл: {filename}")
         
-        # Собираем все сообщения в один список
-        all_messages = []
-        for chat_id, chat_data in data['chats'].items():
-            if 'messages' in chat_data:
-                for message in chat_data['messages']:
-                    # Добавляем информацию о чате к каждому сообщению
-                    message_with_chat = message.copy()
-                    message_with_chat['chat_name'] = chat_data['info']['name']
-                    message_with_chat['chat_type'] = chat_data['info']['type']
-                    all_messages.append(message_with_chat)
-        
-        # Создаем DataFrame и сохраняем в CSV
-        if all_messages:
-            df = pd.DataFrame(all_messages)
-            df.to_csv(filepath, index=False, encoding='utf-8')
-            print(f"✅ CSV файл сохранен: {filepath} ({len(all_messages)} сообщений)")
-        else:
-            print("⚠️ Нет сообщений для экспорта в CSV")
+        # Колонки: ключи сообщений в порядке появления + информация о чате
+        message_columns = {}
+        total_messages = 0
+        for chat_data in data['chats'].values():
+            for message in chat_data.get('messages', ()):
+                message_columns.update(dict.fromkeys(message))
+                total_messages += 1
         
+        if not total_messages:
+            print("⚠️ Нет сообщений для экспорта в CSV")
+            return filepath
+        
+        # Информация о чате пишется последними колонками и перекрывает одноименные поля сообщения
+        message_columns.pop('chat_name', None)
+        message_columns.pop('chat_type', None)
+        columns = list(message_columns)
+        
+        # Пишем строки потоком, не собирая все сообщения в памяти; строка -
+        # это список значений по колонкам, без промежуточного словаря
+        with open(filepath, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, lineterminator=os.linesep)
+            writer.writerow(columns + ['chat_name', 'chat_type'])
+            for chat_id, chat_data in data['chats'].items():
+                chat_info = (chat_data['info']['name'], chat_data['info']['type'])
+                writer.writerows(
+                    [*map(message.get, columns), *chat_info]
+                    for message in chat_data.get('messages', ())
+                )
+        
+        print(f"✅ CSV файл сохранен: {filepath} ({total_messages} сообщений)")
         return filepath
     
-    def export_chat_summary(self, data: Dict[str, Any], filename: str = None) -> str:
+    def _summarize_chats(self, data: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Строки сводки по чатам (по убыванию числа сообщений) и общее число сообщений за один проход
+        """
+        summary = []
+        total_messages = 0
+        for chat_id, chat_data in data['chats'].items():
+            chat_messages = chat_data.get('total_messages', 0)
+            total_messages += chat_messages
+            summary.append({
+                'chat_id': chat_id,
+                'chat_name': chat_data['info']['name'],
+                'chat_type': chat_data['info']['type'],
+                'total_messages': chat_messages,
+                'unread_count': chat_data['info'].get('unread_count', 0),
+                'has_error': 'error' in chat_data
+            })
+        
+        # Сортируем по количеству сообщений
+        summary.sort(key=itemgetter('total_messages'), reverse=True)
+        return summary, total_messages
+    
+    def export_chat_summary(self, data: Dict[str, Any], filename: str = None,
+                            summary: List[Dict[str, Any]] = None) -> str:
         """
         Создаем сводку по чатам
         """
@@ -84,24 +135,15 @@ class DataExporter:
         
         print(f"📈 Создаем сводку по чатам: {filename}")
         
-        # Создаем сводку
-        summary = []
-        for chat_id, chat_data in data['chats'].items():
-            summary_row = {
-                'chat_id': chat_id,
-                'chat_name': chat_data['info']['name'],
-                'chat_type': chat_data['info']['type'],
-                'total_messages': chat_data.get('total_messages', 0),
-                'unread_count': chat_data['info'].get('unread_count', 0),
-                'has_error': 'error' in chat_data
-            }
-            summary.append(summary_row)
+        if summary is None:
+            summary, _ = self._summarize_chats(data)
         
         # Сохраняем в CSV
         if summary:
-            df = pd.DataFrame(summary)
-            df = df.sort_values('total_messages', ascending=False)  # Сортируем по количеству сообщений
-            df.to_csv(filepath, index=False, encoding='utf-8')
+            with open(filepath, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=list(summary[0]), lineterminator=os.linesep)
+                writer.writeheader()
+                writer.writerows(summary)
             print(f"✅ Сводка сохранена: {filepath}")
         
         return filepath
@@ -113,44 +155,59 @@ class DataExporter:
         print("🎯 Экспортируем данные во все форматы...")
         
         exported_files = {}
-        
-        # JSON экспорт
-        if config.EXPORT_FORMATS.get('json', False):
-            exported_files['json'] = self.export_to_json(data)
-        
-        # CSV экспорт
-        if config.EXPORT_FORMATS.get('csv', False):
-            exported_files['csv_messages'] = self.export_to_csv(data)
-            exported_files['csv_summary'] = self.export_chat_summary(data)
+        summary, total_messages = self._summarize_chats(data)
+        
+        # Форматы пишутся в разные файлы и только читают data, поэтому
+        # запускаем их параллельно: запись одного файла не ждет остальные
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = {}
+            
+            # JSON экспорт
+            if config.EXPORT_JSON:
+                futures['json'] = executor.submit(self.export_to_json, data)
+            
+            # CSV экспорт
+            if config.EXPORT_CSV:
+                futures['csv_messages'] = executor.submit(self.export_to_csv, data)
+                futures['csv_summary'] = executor.submit(self.export_chat_summary, data, summary=summary)
+            
+            for file_type, future in futures.items():
+                exported_files[file_type] = future.result()
         
         # Выводим статистику
-        self.print_export_summary(data, exported_files)
+        self.print_export_summary(data, exported_files, total_messages)
         
         return exported_files
     
-    def print_export_summary(self, data: Dict[str, Any], exported_files: Dict[str, str]):
+    def print_export_summary(self, data: Dict[str, Any], exported_files: Dict[str, str],
+                             total_messages: int = None):
         """
         Выводим сводку по экспорту
         """
-        print("\n" + "="*50)
-        print("📊 СВОДКА ПО ЭКСПОРТУ")
-        print("="*50)
+        # Собираем сводку целиком и выводим одним вызовом print
+        lines = [
+            "\n" + "="*50,
+            "📊 СВОДКА ПО ЭКСПОРТУ",
+            "="*50,
+        ]
         
         # Общая статистика
         total_chats = data.get('total_chats', 0)
-        total_messages = sum([
-            chat_data.get('total_messages', 0) 
-            for chat_data in data['chats'].values()
-        ])
+        if total_messages is None:
+            total_messages = sum(
+                chat_data.get('total_messages', 0)
+                for chat_data in data['chats'].values()
+            )
         
-        print(f"📁 Всего чатов: {total_chats}")
-        print(f"💬 Всего сообщений: {total_messages}")
-        print(f"📅 Время экспорта: {data.get('timestamp', 'не указано')}")
+        lines.append(f"📁 Всего чатов: {total_chats}")
+        lines.append(f"💬 Всего сообщений: {total_messages}")
+        lines.append(f"📅 Время экспорта: {data.get('timestamp', 'не указано')}")
         
         # Файлы
-        print(f"\n📄 Созданные файлы:")
+        lines.append(f"\n📄 Созданные файлы:")
         for file_type, filepath in exported_files.items():
-            print(f"   {file_type}: {filepath}")
+            lines.append(f"   {file_type}: {filepath}")
         
-        print("\n🎉 Экспорт завершен! Данные готовы для анализа.")
-        print("="*50)
\ No newline at end of file
+        lines.append("\n🎉 Экспорт завершен! Данные готовы для анализа.")
+        lines.append("="*50)
+        print("\n".join(lines))
\ No newline at end of file
@@ -3,11 +3,199 @@
 """
 import sqlite3
 import json
-from datetime import datetime
-from typing import Dict, List, Any, Optional
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Callable, Iterator, Optional
 import config
 import os
 
+# Запросы горячего пути записи. Одна и та же строка на каждый вызов дает
+# попадание в кэш подготовленных выражений соединения (cached_statements)
+_SQL_SAVE_CHAT = '''
+    INSERT OR REPLACE INTO chats (id, name, type, last_updated)
+    VALUES (?, ?, ?, ?)
+'''
+
+_SQL_SAVE_USER = '''
+    INSERT OR IGNORE INTO users (id, username, first_name, last_name, phone)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+# Текущее состояние сообщений чата по списку ID, переданному JSON-массивом
+_SQL_SELECT_EXISTING = '''
+    SELECT id, text, is_deleted FROM messages
+    WHERE chat_id = ? AND id IN (SELECT value FROM json_each(?))
+'''
+
+# Неизмененное сообщение не перезаписывается: страница не попадает в WAL,
+# а триггеры полнотекстового индекса не срабатывают
+_SQL_UPSERT_MESSAGE = '''
+    INSERT INTO messages
+    (id, chat_id, sender_id, date, text, media_type,
+     reply_to_msg_id, views, forwards)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id, chat_id) DO UPDATE SET
+        text = excluded.text, date = excluded.date,
+        media_type = excluded.media_type,
+        reply_to_msg_id = excluded.reply_to_msg_id,
+        views = excluded.views, forwards = excluded.forwards
+    WHERE text IS NOT excluded.text OR date IS NOT excluded.date
+        OR media_type IS NOT excluded.media_type
+        OR reply_to_msg_id IS NOT excluded.reply_to_msg_id
+        OR views IS NOT excluded.views OR forwards IS NOT excluded.forwards
+'''
+
+_SQL_INSERT_HISTORY = '''
+    INSERT INTO message_history
+    (message_id, chat_id, action_type, old_text, new_text, scan_session)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+# Сообщения чата, которых нет в текущем списке ID (JSON-массив :ids).
+# Индекс указан явно: после ANALYZE статистика индекса по дням недели
+# выглядит не хуже, но он не содержит id и требует чтения строк таблицы
+_SQL_LOG_DELETED = '''
+    INSERT INTO message_history
+    (message_id, chat_id, action_type, old_text, new_text, scan_session)
+    SELECT id, chat_id, 'deleted', text, NULL, :session_id
+    FROM messages INDEXED BY idx_messages_live
+    WHERE chat_id = :chat_id AND is_deleted = 0
+    AND id NOT IN (SELECT value FROM json_each(:ids))
+'''
+
+_SQL_MARK_DELETED = '''
+    UPDATE messages INDEXED BY idx_messages_live SET is_deleted = 1
+    WHERE chat_id = :chat_id AND is_deleted = 0
+    AND id NOT IN (SELECT value FROM json_each(:ids))
+'''
+
+
+# Токенизатор FTS5-индекса сообщений: remove_diacritics 0 сохраняет "й" и "ё",
+# цифры и "_" - разделители. Аналитика считает слова тем же токенизатором
+FULLTEXT_TOKENIZE = "unicode61 remove_diacritics 0 separators '0123456789_'"
+
+
+def connect_db(db_path: str, check_same_thread: bool = True,
+               read_only: bool = False) -> sqlite3.Connection:
+    """
+    Открывает соединение с БД для аналитических чтений и записи монитора:
+    WAL (читатели не блокируют писателя и друг друга), synchronous=NORMAL,
+    временные таблицы в памяти, mmap 256MB и кэш страниц 64MB.
+    Пока парсер держит блокировку записи, запрос ждет до 5 секунд.
+    Запросы с параметрами не меняют текст SQL, поэтому скомпилированные
+    выражения переиспользуются из увеличенного кэша соединения
+
+    Args:
+        read_only: Запретить соединению любые изменения базы (query_only)
+    """
+    conn = sqlite3.connect(db_path, check_same_thread=check_same_thread,
+                           cached_statements=256)
+    # mmap_size задается до первого чтения страниц базы
+    conn.executescript('''
+        PRAGMA mmap_size=268435456;
+        PRAGMA busy_timeout=5000;
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-65536;
+    ''')
+    if read_only:
+        conn.execute('PRAGMA query_only=ON')
+    return conn
+
+
+# Сколько соединений с БД держит один объект TelegramDatabase
+_POOL_SIZE = 8
+
+
+def _reset_connection(conn: sqlite3.Connection):
+    """Соединение возвращается в пул: сбрасываем настройки, выставленные методом"""
+    conn.row_factory = None
+
+
+class ConnectionPool:
+    """
+    Ограниченный пул соединений с БД
+
+    Поток получает соединение на время блока connection() и возвращает его
+    в пул при выходе, поэтому число соединений не растет с числом потоков
+    (веб-сервер создает поток на каждый запрос). Вложенные блоки того же
+    потока получают уже выданное ему соединение. Если все соединения заняты,
+    поток ждет, пока какое-нибудь освободится, но не дольше timeout секунд:
+    соединения, удерживаемые недочитанными итераторами, не блокируют
+    остальные вызовы навсегда.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], max_size: int,
+                 reset: Optional[Callable[[sqlite3.Connection], None]] = None,
+                 timeout: float = 30.0):
+        """
+        Args:
+            connect: Открывает новое соединение
+            max_size: Максимальное число открытых соединений
+            reset: Приводит соединение в исходное состояние перед возвратом в пул
+            timeout: Сколько секунд ждать свободного соединения
+        """
+        self._connect = connect
+        self._max_size = max_size
+        self._reset = reset
+        self._timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _acquire(self) -> sqlite3.Connection:
+        """Берет свободное соединение, открывает новое или ждет освобождения"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._connections) < self._max_size:
+                conn = self._connect()
+                self._connections.append(conn)
+                return conn
+
+        try:
+            return self._idle.get(timeout=self._timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"Нет свободного соединения с базой данных за {self._timeout} с: "
+                f"все {self._max_size} соединений пула заняты"
+            ) from None
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Выдает соединение текущему потоку на время блока"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if self._reset is not None:
+                self._reset(conn)
+            self._idle.put(conn)
+
+    def close(self):
+        """Закрывает все соединения пула"""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+            self._idle = queue.LifoQueue()
+        self._local = threading.local()
+
+
 class TelegramDatabase:
     """
     Класс для работы с базой данных истории сообщений
@@ -23,6 +211,25 @@ class TelegramDatabase:
 
         self.db_path = db_path
 
+        # Ограниченный пул долгоживущих соединений: веб-интерфейс вызывает
+        # методы из разных потоков, PRAGMA применяются один раз на соединение
+        self._pool = ConnectionPool(self._connect, _POOL_SIZE, reset=_reset_connection)
+
+        # Кэш запросов опроса по chat_id: дата последнего сообщения и время
+        # последнего изменения. Сбрасывается для чата после записи в него
+        self._last_message_dates: Dict[int, Optional[str]] = {}
+        self._last_change_times: Dict[int, Optional[str]] = {}
+
+        # Фоновая запись сообщений парсера: ограниченная очередь и поток-писатель,
+        # который берет соединение из пула на каждую пачку. Поток запускается
+        # при первой постановке в очередь. Сообщения, которые не удалось записать
+        # и при повторе по одному, остаются в failed_writes вместе с сессией
+        self._write_queue = queue.Queue(maxsize=10_000)
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._writer_error = None
+        self.failed_writes: List[tuple] = []
+
         # Создаем директорию для любого пути к базе данных
         db_dir = os.path.dirname(self.db_path)
         if db_dir and not os.path.exists(db_dir):
@@ -30,11 +237,64 @@ class TelegramDatabase:
 
         self.init_database()
 
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Открывает соединение с БД, настроенное под частую запись парсера:
+        synchronous=NORMAL (в режиме WAL fsync только на checkpoint),
+        кэш страниц 16MB, mmap 64MB, временные таблицы в памяти и
+        автоматический checkpoint WAL каждые 2000 страниц.
+        Запросы с параметрами не меняют текст SQL, поэтому скомпилированные
+        выражения переиспользуются из увеличенного кэша соединения
+        """
+        conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                               cached_statements=256)
+        conn.executescript('''
+            PRAGMA mmap_size=67108864;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA cache_size=-16000;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA wal_autocheckpoint=2000;
+        ''')
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Отдает соединение из пула на время блока.
+        Изменения фиксируются при выходе из блока, при ошибке откатываются
+        """
+        with self._pool.connection() as conn:
+            with conn:
+                yield conn
+
+    def close(self):
+        """
+        Дописывает очередь фоновой записи и закрывает все соединения с базой данных.
+        Ошибка записи последних пачек пробрасывается после закрытия соединений
+        """
+        try:
+            with self._writer_lock:
+                writer, self._writer = self._writer, None
+            if writer is not None:
+                self._write_queue.put(None)
+                writer.join()
+        finally:
+            self._pool.close()
+
+        self._raise_writer_error()
+
     def init_database(self):
         """Создание таблиц в базе данных"""
         print(f"🗄️ Инициализация базы данных: {self.db_path}")
 
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
+            # Режим журнала сохраняется в файле базы, достаточно включить один раз.
+            # page_size действует только для новой базы и задается до перехода в WAL
+            conn.executescript('''
+                PRAGMA page_size=8192;
+                PRAGMA journal_mode=WAL;
+            ''')
+
             conn.executescript('''
                 -- Таблица чатов
                 CREATE TABLE IF NOT EXISTS chats (
@@ -68,7 +328,7 @@ class TelegramDatabase:
                     views INTEGER,
                     forwards INTEGER,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_deleted BOOLEAN DEFAULT FALSE,
+                    is_deleted INTEGER NOT NULL DEFAULT 0 CHECK (is_deleted IN (0, 1)),
                     PRIMARY KEY (id, chat_id),
                     FOREIGN KEY (chat_id) REFERENCES chats (id),
                     FOREIGN KEY (sender_id) REFERENCES users (id)
@@ -112,18 +372,268 @@ class TelegramDatabase:
 
                 -- Индексы для быстрого поиска
                 CREATE INDEX IF NOT EXISTS idx_messages_chat_date ON messages(chat_id, date);
+                CREATE INDEX IF NOT EXISTS idx_messages_active_date ON messages(is_deleted, date);
                 CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages(sender_id);
+                -- Покрывающий индекс для активности по дням недели и часам
+                CREATE INDEX IF NOT EXISTS idx_messages_active_weekday_hour
+                    ON messages(is_deleted, chat_id, strftime('%w', date), strftime('%H', date));
+                -- Индекс под фильтры is_deleted = 0 AND chat_id = ? [ORDER BY date].
+                -- Частичный индекс содержит только неудаленные сообщения; планировщик
+                -- выбирает его, когда в запросе условие записано как is_deleted = 0.
+                -- Колонка is_deleted в ключе почти ничего не стоит (0 хранится без
+                -- байтов данных), но дает планировщику точное совпадение и без ANALYZE.
+                -- id в конце ключа покрывает сравнение со списком текущих ID
+                -- в mark_deleted_messages без чтения строк таблицы. Индекс создается
+                -- после индекса по дням недели: при равной оценке планировщик
+                -- предпочитает более поздний
+                DROP INDEX IF EXISTS idx_messages_chat_active_date;
+                DROP INDEX IF EXISTS idx_messages_active;
+                CREATE INDEX IF NOT EXISTS idx_messages_live
+                    ON messages(chat_id, is_deleted, date, id) WHERE is_deleted = 0;
                 CREATE INDEX IF NOT EXISTS idx_history_message ON message_history(message_id, chat_id);
+                -- Покрывающие индексы для сводок изменений за период: фильтр по
+                -- [chat_id и] timestamp, группировка по action_type (и chat_id)
+                -- читаются из индекса без обращения к таблице
+                DROP INDEX IF EXISTS idx_history_chat_time;
+                DROP INDEX IF EXISTS idx_history_time;
+                CREATE INDEX IF NOT EXISTS idx_history_chat_time_action
+                    ON message_history(chat_id, timestamp, action_type);
+                CREATE INDEX IF NOT EXISTS idx_history_time_action
+                    ON message_history(timestamp, action_type, chat_id);
+                -- Частичные индексы только по правкам и удалениям: записи 'created'
+                -- составляют основную часть истории, а списки отредактированных и
+                -- удаленных сообщений их не читают
+                CREATE INDEX IF NOT EXISTS idx_history_edited
+                    ON message_history(chat_id, message_id, timestamp) WHERE action_type = 'edited';
+                CREATE INDEX IF NOT EXISTS idx_history_deleted
+                    ON message_history(chat_id, timestamp) WHERE action_type = 'deleted';
                 CREATE INDEX IF NOT EXISTS idx_reactions_message ON message_reactions(message_id, chat_id);
             ''')
 
+            self._init_fulltext_index(conn)
+            self._init_chat_stats(conn)
+            self._init_chat_senders(conn)
+
         print("✅ База данных инициализирована")
 
+    def _init_chat_stats(self, conn: sqlite3.Connection):
+        """
+        Создает таблицу chat_stats со счетчиками по чатам для get_chat_statistics
+
+        Счетчики неудаленных сообщений и правок/удалений поддерживаются
+        триггерами при записи, поэтому статистика не пересчитывается
+        агрегацией по всей истории на каждый вызов
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'chat_stats'"
+        ).fetchone()
+        if exists:
+            return
+
+        conn.executescript('''
+            CREATE TABLE chat_stats (
+                chat_id INTEGER PRIMARY KEY,
+                total_messages INTEGER NOT NULL DEFAULT 0,
+                edited_count INTEGER NOT NULL DEFAULT 0,
+                deleted_count INTEGER NOT NULL DEFAULT 0
+            );
+
+            CREATE TRIGGER chat_stats_message_insert AFTER INSERT ON messages
+            WHEN new.is_deleted = 0 BEGIN
+                INSERT INTO chat_stats (chat_id, total_messages) VALUES (new.chat_id, 1)
+                ON CONFLICT (chat_id) DO UPDATE SET total_messages = total_messages + 1;
+            END;
+
+            CREATE TRIGGER chat_stats_message_update AFTER UPDATE OF is_deleted ON messages
+            WHEN old.is_deleted != new.is_deleted BEGIN
+                UPDATE chat_stats
+                SET total_messages = total_messages + (CASE WHEN new.is_deleted THEN -1 ELSE 1 END)
+                WHERE chat_id = new.chat_id;
+            END;
+
+            CREATE TRIGGER chat_stats_message_delete AFTER DELETE ON messages
+            WHEN old.is_deleted = 0 BEGIN
+                UPDATE chat_stats SET total_messages = total_messages - 1
+                WHERE chat_id = old.chat_id;
+            END;
+
+            CREATE TRIGGER chat_stats_history_insert AFTER INSERT ON message_history
+            WHEN new.action_type IN ('edited', 'deleted') BEGIN
+                INSERT INTO chat_stats (chat_id, edited_count, deleted_count)
+                VALUES (new.chat_id, new.action_type = 'edited', new.action_type = 'deleted')
+                ON CONFLICT (chat_id) DO UPDATE SET
+                    edited_count = edited_count + (new.action_type = 'edited'),
+                    deleted_count = deleted_count + (new.action_type = 'deleted');
+            END;
+
+            -- Первичное заполнение для уже существующей базы
+            INSERT INTO chat_stats (chat_id, total_messages, edited_count, deleted_count)
+            SELECT
+                chat_id,
+                SUM(total_messages),
+                SUM(edited_count),
+                SUM(deleted_count)
+            FROM (
+                SELECT chat_id, COUNT(*) as total_messages, 0 as edited_count, 0 as deleted_count
+                FROM messages
+                WHERE is_deleted = 0
+                GROUP BY chat_id
+                UNION ALL
+                SELECT
+                    chat_id,
+                    0,
+                    COUNT(CASE WHEN action_type = 'edited' THEN 1 END),
+                    COUNT(CASE WHEN action_type = 'deleted' THEN 1 END)
+                FROM message_history
+                GROUP BY chat_id
+            )
+            GROUP BY chat_id;
+        ''')
+
+    def _init_chat_senders(self, conn: sqlite3.Connection):
+        """
+        Создает таблицу chat_senders с числом неудаленных сообщений каждого
+        отправителя в чате
+
+        Число уникальных отправителей в get_chat_statistics считается по ней
+        без COUNT(DISTINCT) по всем сообщениям чата. Строка отправителя
+        удаляется триггером, когда у него не остается сообщений
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'chat_senders'"
+        ).fetchone()
+        if exists:
+            return
+
+        conn.executescript('''
+            CREATE TABLE chat_senders (
+                chat_id INTEGER NOT NULL,
+                sender_id INTEGER NOT NULL,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (chat_id, sender_id)
+            ) WITHOUT ROWID;
+
+            CREATE TRIGGER chat_senders_message_insert AFTER INSERT ON messages
+            WHEN new.is_deleted = 0 AND new.sender_id IS NOT NULL BEGIN
+                INSERT INTO chat_senders (chat_id, sender_id, message_count)
+                VALUES (new.chat_id, new.sender_id, 1)
+                ON CONFLICT (chat_id, sender_id) DO UPDATE SET message_count = message_count + 1;
+            END;
+
+            CREATE TRIGGER chat_senders_message_update AFTER UPDATE OF is_deleted, sender_id ON messages
+            WHEN old.is_deleted IS NOT new.is_deleted OR old.sender_id IS NOT new.sender_id BEGIN
+                UPDATE chat_senders SET message_count = message_count - 1
+                WHERE old.is_deleted = 0
+                  AND chat_id = old.chat_id AND sender_id = old.sender_id;
+                INSERT INTO chat_senders (chat_id, sender_id, message_count)
+                SELECT new.chat_id, new.sender_id, 1
+                WHERE new.is_deleted = 0 AND new.sender_id IS NOT NULL
+                ON CONFLICT (chat_id, sender_id) DO UPDATE SET message_count = message_count + 1;
+                DELETE FROM chat_senders
+                WHERE chat_id = old.chat_id AND sender_id = old.sender_id AND message_count <= 0;
+            END;
+
+            CREATE TRIGGER chat_senders_message_delete AFTER DELETE ON messages
+            WHEN old.is_deleted = 0 AND old.sender_id IS NOT NULL BEGIN
+                UPDATE chat_senders SET message_count = message_count - 1
+                WHERE chat_id = old.chat_id AND sender_id = old.sender_id;
+                DELETE FROM chat_senders
+                WHERE chat_id = old.chat_id AND sender_id = old.sender_id AND message_count <= 0;
+            END;
+
+            -- Первичное заполнение для уже существующей базы
+            INSERT INTO chat_senders (chat_id, sender_id, message_count)
+            SELECT chat_id, sender_id, COUNT(*)
+            FROM messages
+            WHERE is_deleted = 0 AND sender_id IS NOT NULL
+            GROUP BY chat_id, sender_id;
+        ''')
+
+    def _init_fulltext_index(self, conn: sqlite3.Connection):
+        """
+        Создает FTS5-индекс текстов для подсчета частотности слов в SQLite
+
+        Индексируются только сообщения, которые учитывает анализ тем
+        (не удаленные и длиннее 10 символов); триггеры поддерживают индекс
+        в актуальном состоянии. Если сборка SQLite без FTS5 - индекс
+        не создается, и аналитика считает слова в Python.
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+        ).fetchone()
+
+        try:
+            if not exists:
+                conn.executescript('''
+                    -- Внешний контент: текст хранится только в messages
+                    CREATE VIRTUAL TABLE messages_fts USING fts5(
+                        text, content='messages', content_rowid='rowid',
+                        tokenize="''' + FULLTEXT_TOKENIZE + '''"
+                    );
+                    CREATE VIRTUAL TABLE messages_fts_vocab USING fts5vocab(messages_fts, 'row');
+
+                    CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages
+                    WHEN new.is_deleted = 0 AND LENGTH(new.text) > 10 BEGIN
+                        INSERT INTO messages_fts(rowid, text) VALUES (new.rowid, new.text);
+                    END;
+
+                    CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages
+                    WHEN old.is_deleted = 0 AND LENGTH(old.text) > 10 BEGIN
+                        INSERT INTO messages_fts(messages_fts, rowid, text)
+                        VALUES ('delete', old.rowid, old.text);
+                    END;
+                ''')
+
+            self._init_fulltext_update_trigger(conn, rebuild=bool(exists))
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ Полнотекстовый индекс недоступен: {e}")
+
+    def _init_fulltext_update_trigger(self, conn: sqlite3.Connection, rebuild: bool):
+        """
+        Создает триггер обновления FTS5-индекса при изменении текста или удалении
+
+        Удаление старого текста и вставка нового выполняются одним триггером
+        строго в этом порядке: 'delete' после вставки той же rowid убрал бы
+        и общие для двух версий слова. Обновления без изменения текста и
+        is_deleted (например, только просмотров) индекс не трогают.
+        Базы с прежней парой триггеров перестраивают индекс заново.
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts_update'"
+        ).fetchone()
+        if exists:
+            return
+
+        conn.executescript('''
+            DROP TRIGGER IF EXISTS messages_fts_update_old;
+            DROP TRIGGER IF EXISTS messages_fts_update_new;
+
+            CREATE TRIGGER messages_fts_update AFTER UPDATE OF text, is_deleted ON messages
+            WHEN old.text IS NOT new.text OR old.is_deleted IS NOT new.is_deleted BEGIN
+                INSERT INTO messages_fts(messages_fts, rowid, text)
+                SELECT 'delete', old.rowid, old.text
+                WHERE old.is_deleted = 0 AND LENGTH(old.text) > 10;
+                INSERT INTO messages_fts(rowid, text)
+                SELECT new.rowid, new.text
+                WHERE new.is_deleted = 0 AND LENGTH(new.text) > 10;
+            END;
+        ''')
+
+        if rebuild:
+            conn.execute("INSERT INTO messages_fts(messages_fts) VALUES ('delete-all')")
+
+        # Заполнение индекса для новой или перестраиваемой базы
+        conn.execute('''
+            INSERT INTO messages_fts(rowid, text)
+            SELECT rowid, text FROM messages
+            WHERE is_deleted = 0 AND LENGTH(text) > 10
+        ''')
+
     def create_scan_session(self) -> str:
         """Создает новую сессию парсинга"""
         session_id = f"scan_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             conn.execute('''
                 INSERT INTO scan_sessions (id, start_time)
                 VALUES (?, ?)
@@ -134,150 +644,267 @@ class TelegramDatabase:
 
     def save_chat(self, chat_data: Dict) -> None:
         """Сохраняет информацию о чате"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute('''
-                INSERT OR REPLACE INTO chats (id, name, type, last_updated)
-                VALUES (?, ?, ?, ?)
-            ''', (
+        with self._connection() as conn:
+            conn.execute(_SQL_SAVE_CHAT, (
                 chat_data['id'],
                 chat_data['name'],
                 chat_data['type'],
                 datetime.now()
             ))
 
+    def save_users_batch(self, users: List[Dict]) -> None:
+        """
+        Сохраняет пачку пользователей одной транзакцией.
+        Уже известные пользователи не перезаписываются
+        """
+        if not users:
+            return
+
+        with self._connection() as conn:
+            conn.executemany(_SQL_SAVE_USER, [
+                (
+                    user['id'],
+                    user.get('username'),
+                    user.get('first_name'),
+                    user.get('last_name'),
+                    user.get('phone')
+                )
+                for user in users
+            ])
+
+    def queue_message_save(self, message_data: Dict, session_id: str) -> None:
+        """
+        Ставит сообщение в очередь фоновой записи и сразу возвращает управление.
+        Поток-писатель сохраняет накопившиеся сообщения пачками через
+        save_messages_batch. При заполненной очереди вызов ждет, пока
+        писатель ее разгрузит
+        """
+        self._raise_writer_error()
+
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._writer_loop, name='telegram-db-writer', daemon=True
+                )
+                self._writer.start()
+
+        self._write_queue.put((message_data, session_id))
+
+    def flush_writes(self) -> None:
+        """Дожидается записи всех сообщений, поставленных в очередь"""
+        if self._writer is not None:
+            self._write_queue.join()
+        self._raise_writer_error()
+
+    def _raise_writer_error(self):
+        """Пробрасывает ошибку, возникшую в потоке-писателе"""
+        error, self._writer_error = self._writer_error, None
+        if error is not None:
+            raise error
+
+    def _writer_loop(self):
+        """Цикл потока-писателя: забирает из очереди все, что накопилось, и пишет пачкой"""
+        while True:
+            items = [self._write_queue.get()]
+            while items[-1] is not None and len(items) < 1000:
+                try:
+                    items.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = items[-1] is None
+            if stop:
+                items.pop()
+
+            # Подряд идущие сообщения одной сессии пишутся одной транзакцией
+            batches = []
+            for message_data, session_id in items:
+                if batches and batches[-1][1] == session_id:
+                    batches[-1][0].append(message_data)
+                else:
+                    batches.append(([message_data], session_id))
+
+            try:
+                for batch, session_id in batches:
+                    self._write_batch(batch, session_id)
+            finally:
+                for _ in range(len(items) + stop):
+                    self._write_queue.task_done()
+
+            if stop:
+                return
+
+    def _write_batch(self, messages: List[Dict], session_id: str) -> None:
+        """
+        Записывает пачку из очереди. Если пачка не записалась, сообщения
+        повторяются по одному, чтобы одно проблемное сообщение не теряло
+        всю пачку; не записанные и при повторе попадают в failed_writes
+        """
+        try:
+            self.save_messages_batch(messages, session_id)
+            return
+        except Exception as e:
+            print(f"⚠️ Ошибка записи пачки из {len(messages)} сообщений: {e}, повторяем по одному")
+
+        for message_data in messages:
+            try:
+                self.save_messages_batch([message_data], session_id)
+            except Exception as e:
+                print(f"❌ Ошибка фоновой записи сообщения {message_data.get('id')}: {e}")
+                self.failed_writes.append((message_data, session_id))
+                if self._writer_error is None:
+                    self._writer_error = e
+
     def save_message_with_history(self, message_data: Dict, session_id: str) -> None:
         """
         Сохраняет сообщение и отслеживает изменения
+
+        Устаревший интерфейс: каждый вызов - отдельная транзакция. Для пачек
+        сообщений используйте save_messages_batch или queue_message_save
         """
-        message_id = message_data['id']
-        chat_id = message_data['chat_id']
-        current_text = message_data.get('text', '')
-
-        with sqlite3.connect(self.db_path) as conn:
-            # Проверяем, есть ли уже это сообщение
-            existing = conn.execute('''
-                SELECT text, is_deleted FROM messages
-                WHERE id = ? AND chat_id = ?
-            ''', (message_id, chat_id)).fetchone()
-
-            if existing:
-                old_text, is_deleted = existing
-
-                # Проверяем изменения
-                if old_text != current_text and not is_deleted:
-                    # Сообщение было отредактировано
-                    self._log_message_change(
-                        conn, message_id, chat_id, 'edited',
-                        old_text, current_text, session_id
-                    )
-                    print(f"📝 Обнаружено редактирование сообщения {message_id}")
-
-                # Обновляем сообщение
-                conn.execute('''
-                    UPDATE messages SET
-                        text = ?, date = ?, media_type = ?,
-                        reply_to_msg_id = ?, views = ?, forwards = ?
-                    WHERE id = ? AND chat_id = ?
-                ''', (
-                    current_text,
-                    message_data.get('date'),
-                    message_data.get('media_type'),
-                    message_data.get('reply_to'),
-                    message_data.get('views', 0),
-                    message_data.get('forwards', 0),
-                    message_id,
-                    chat_id
-                ))
-            else:
-                # Новое сообщение
-                conn.execute('''
-                    INSERT INTO messages
-                    (id, chat_id, sender_id, date, text, media_type,
-                     reply_to_msg_id, views, forwards)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    message_id,
-                    chat_id,
+        self.save_messages_batch([message_data], session_id)
+
+    def save_messages_batch(self, messages: List[Dict], session_id: str) -> None:
+        """
+        Сохраняет пачку сообщений одной транзакцией и отслеживает изменения
+
+        Уже сохраненные сообщения загружаются одним запросом на чат, сообщения
+        пишутся одним UPSERT через executemany, записи истории - следом
+        """
+        if not messages:
+            return
+
+        with self._connection() as conn:
+            # Текущее состояние сообщений пачки: {(chat_id, id): (text, is_deleted)}.
+            # Список ID передается одним JSON-параметром, без лимита на число параметров
+            ids_by_chat = {}
+            for message_data in messages:
+                ids_by_chat.setdefault(message_data['chat_id'], []).append(message_data['id'])
+
+            existing = {}
+            for chat_id, message_ids in ids_by_chat.items():
+                rows = conn.execute(_SQL_SELECT_EXISTING, (chat_id, json.dumps(message_ids)))
+                for message_id, text, is_deleted in rows:
+                    existing[(chat_id, message_id)] = (text, is_deleted)
+
+            history_rows = []
+            for message_data in messages:
+                message_id = message_data['id']
+                chat_id = message_data['chat_id']
+                current_text = message_data.get('text', '')
+                key = (chat_id, message_id)
+
+                if key in existing:
+                    old_text, is_deleted = existing[key]
+
+                    # Проверяем изменения
+                    if old_text != current_text and not is_deleted:
+                        # Сообщение было отредактировано
+                        history_rows.append((
+                            message_id, chat_id, 'edited',
+                            old_text, current_text, session_id
+                        ))
+                        print(f"📝 Обнаружено редактирование сообщения {message_id}")
+                else:
+                    # Логируем создание нового сообщения
+                    history_rows.append((
+                        message_id, chat_id, 'created',
+                        None, current_text, session_id
+                    ))
+                    is_deleted = False
+
+                # Повтор того же сообщения в пачке сравнивается с этой версией
+                existing[key] = (current_text, is_deleted)
+
+            # Вставка и обновление одним UPSERT: строки пишутся в порядке пачки,
+            # существующая строка обновляется на месте (rowid и полнотекстовый
+            # индекс сохраняются, в отличие от INSERT OR REPLACE)
+            conn.executemany(_SQL_UPSERT_MESSAGE, [
+                (
+                    message_data['id'],
+                    message_data['chat_id'],
                     message_data.get('sender_id'),
                     message_data.get('date'),
-                    current_text,
+                    message_data.get('text', ''),
                     message_data.get('media_type'),
                     message_data.get('reply_to'),
                     message_data.get('views', 0),
                     message_data.get('forwards', 0)
-                ))
-
-                # Логируем создание
-                self._log_message_change(
-                    conn, message_id, chat_id, 'created',
-                    None, current_text, session_id
                 )
+                for message_data in messages
+            ])
+
+            self._log_message_changes(conn, history_rows)
+
+        # Кэш сбрасывается после фиксации транзакции
+        self._invalidate_chat_cache(ids_by_chat)
+
+    def _invalidate_chat_cache(self, chat_ids):
+        """Сбрасывает кэш опроса для чатов, в которые были записаны изменения"""
+        for chat_id in chat_ids:
+            self._last_message_dates.pop(chat_id, None)
+            self._last_change_times.pop(chat_id, None)
 
     def mark_deleted_messages(self, chat_id: int, current_message_ids: List[int], session_id: str) -> int:
         """
         Помечает сообщения как удаленные, если их нет в текущем парсинге
         """
-        with sqlite3.connect(self.db_path) as conn:
-            if current_message_ids:
-                # Находим сообщения, которых нет в текущем списке
-                placeholders = ','.join(['?' for _ in current_message_ids])
-                deleted_messages = conn.execute(f'''
-                    SELECT id, text FROM messages
-                    WHERE chat_id = ? AND is_deleted = FALSE
-                    AND id NOT IN ({placeholders})
-                ''', [chat_id] + current_message_ids).fetchall()
-            else:
-                # Если нет текущих сообщений, все помечаем как удаленные
-                deleted_messages = conn.execute('''
-                    SELECT id, text FROM messages
-                    WHERE chat_id = ? AND is_deleted = FALSE
-                ''', (chat_id,)).fetchall()
-
-            # Помечаем как удаленные и логируем
-            deleted_count = 0
-            for msg_id, old_text in deleted_messages:
-                conn.execute('''
-                    UPDATE messages SET is_deleted = TRUE
-                    WHERE id = ? AND chat_id = ?
-                ''', (msg_id, chat_id))
-
-                self._log_message_change(
-                    conn, msg_id, chat_id, 'deleted',
-                    old_text, None, session_id
-                )
-                deleted_count += 1
+        # Сообщения из очереди должны быть записаны до сравнения списков
+        self.flush_writes()
 
-            if deleted_count > 0:
-                print(f"🗑️ Помечено как удаленные: {deleted_count} сообщений")
+        with self._connection() as conn:
+            # Сообщения, которых нет в текущем списке (пустой список - все
+            # сообщения чата), логируются и помечаются двумя запросами на стороне
+            # SQLite, без передачи текстов в Python. Список передается одним
+            # JSON-параметром: текст запроса не зависит от размера чата
+            params = {'chat_id': chat_id, 'ids': json.dumps(current_message_ids),
+                      'session_id': session_id}
+            conn.execute(_SQL_LOG_DELETED, params)
+            deleted_count = conn.execute(_SQL_MARK_DELETED, params).rowcount
 
-            return deleted_count
+        if deleted_count > 0:
+            self._invalidate_chat_cache([chat_id])
+            print(f"🗑️ Помечено как удаленные: {deleted_count} сообщений")
+
+        return deleted_count
 
     def _log_message_change(self, conn, message_id: int, chat_id: int,
                            action: str, old_text: str, new_text: str, session_id: str):
         """Логирует изменение сообщения"""
-        conn.execute('''
-            INSERT INTO message_history
-            (message_id, chat_id, action_type, old_text, new_text, scan_session)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (message_id, chat_id, action, old_text, new_text, session_id))
+        self._log_message_changes(conn, [(message_id, chat_id, action, old_text, new_text, session_id)])
+
+    def _log_message_changes(self, conn, changes: List[tuple]):
+        """
+        Логирует пачку изменений одним подготовленным запросом
+
+        Args:
+            changes: Кортежи (message_id, chat_id, action, old_text, new_text, session_id)
+        """
+        if not changes:
+            return
+
+        conn.executemany(_SQL_INSERT_HISTORY, changes)
 
     def get_chat_statistics(self) -> List[Dict]:
         """Получает статистику по чатам"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             conn.row_factory = sqlite3.Row
+            # Счетчики берутся из chat_stats и chat_senders, даты - по индексу
+            # idx_messages_live, без соединения с message_history
             stats = conn.execute('''
                 SELECT
                     c.id, c.name, c.type,
-                    COUNT(m.id) as total_messages,
-                    COUNT(DISTINCT m.sender_id) as unique_senders,
-                    MIN(m.date) as first_message,
-                    MAX(m.date) as last_message,
-                    COUNT(CASE WHEN mh.action_type = 'edited' THEN 1 END) as edited_count,
-                    COUNT(CASE WHEN mh.action_type = 'deleted' THEN 1 END) as deleted_count
+                    COALESCE(s.total_messages, 0) as total_messages,
+                    (SELECT COUNT(*) FROM chat_senders
+                     WHERE chat_id = c.id) as unique_senders,
+                    (SELECT MIN(date) FROM messages
+                     WHERE chat_id = c.id AND is_deleted = 0) as first_message,
+                    (SELECT MAX(date) FROM messages
+                     WHERE chat_id = c.id AND is_deleted = 0) as last_message,
+                    COALESCE(s.edited_count, 0) as edited_count,
+                    COALESCE(s.deleted_count, 0) as deleted_count
                 FROM chats c
-                LEFT JOIN messages m ON c.id = m.chat_id AND m.is_deleted = FALSE
-                LEFT JOIN message_history mh ON m.id = mh.message_id AND m.chat_id = mh.chat_id
-                GROUP BY c.id, c.name, c.type
+                LEFT JOIN chat_stats s ON s.chat_id = c.id
                 ORDER BY total_messages DESC
             ''').fetchall()
 
@@ -285,8 +912,9 @@ class TelegramDatabase:
 
     def get_changes_summary(self, days: int = 7) -> Dict:
         """Получает сводку изменений за последние дни"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             conn.row_factory = sqlite3.Row
+            period = f'-{int(days)} days'
 
             # Изменения за период
             changes = conn.execute('''
@@ -295,9 +923,9 @@ class TelegramDatabase:
                     COUNT(*) as count,
                     COUNT(DISTINCT chat_id) as affected_chats
                 FROM message_history
-                WHERE timestamp > datetime('now', '-{} days')
+                WHERE timestamp > datetime('now', ?)
                 GROUP BY action_type
-            '''.format(days)).fetchall()
+            ''', (period,)).fetchall()
 
             # Самые активные чаты по изменениям
             active_chats = conn.execute('''
@@ -306,11 +934,11 @@ class TelegramDatabase:
                     COUNT(mh.id) as changes_count
                 FROM message_history mh
                 JOIN chats c ON mh.chat_id = c.id
-                WHERE mh.timestamp > datetime('now', '-{} days')
+                WHERE mh.timestamp > datetime('now', ?)
                 GROUP BY c.id, c.name
                 ORDER BY changes_count DESC
                 LIMIT 10
-            '''.format(days)).fetchall()
+            ''', (period,)).fetchall()
 
             return {
                 'period_days': days,
@@ -320,7 +948,9 @@ class TelegramDatabase:
 
     def close_scan_session(self, session_id: str, stats: Dict):
         """Закрывает сессию парсинга"""
-        with sqlite3.connect(self.db_path) as conn:
+        self.flush_writes()
+
+        with self._connection() as conn:
             conn.execute('''
                 UPDATE scan_sessions SET
                     end_time = ?,
@@ -336,48 +966,74 @@ class TelegramDatabase:
                 session_id
             ))
 
+        # Статистика для планировщика: первый раз полный ANALYZE, далее
+        # PRAGMA optimize обновляет ее только для заметно изменившихся таблиц.
+        # После сканирования переносим WAL в базу и обрезаем файл журнала,
+        # чтобы последующие чтения не просматривали разросшийся WAL
+        with self._connection() as conn:
+            analyzed = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+            ).fetchone()
+            conn.execute('PRAGMA optimize' if analyzed else 'ANALYZE')
+            conn.commit()
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
         print(f"✅ Сессия {session_id} завершена")
 
     def get_last_message_date(self, chat_id: int) -> Optional[str]:
         """Получает дату последнего сообщения в чате"""
-        with sqlite3.connect(self.db_path) as conn:
+        self.flush_writes()
+
+        if chat_id in self._last_message_dates:
+            return self._last_message_dates[chat_id]
+
+        with self._connection() as conn:
             result = conn.execute('''
                 SELECT MAX(date) FROM messages
-                WHERE chat_id = ? AND is_deleted = FALSE
+                WHERE chat_id = ? AND is_deleted = 0
             ''', (chat_id,)).fetchone()
 
-            return result[0] if result and result[0] else None
+        last_date = result[0] if result and result[0] else None
+        self._last_message_dates[chat_id] = last_date
+        return last_date
 
     def get_cached_message_count(self, chat_id: int) -> int:
         """Получает количество кэшированных сообщений в чате"""
-        with sqlite3.connect(self.db_path) as conn:
+        self.flush_writes()
+
+        with self._connection() as conn:
             result = conn.execute('''
                 SELECT COUNT(*) FROM messages
-                WHERE chat_id = ? AND is_deleted = FALSE
+                WHERE chat_id = ? AND is_deleted = 0
             ''', (chat_id,)).fetchone()
 
             return result[0] if result else 0
 
     def should_check_for_changes(self, chat_id: int, hours_threshold: int = 24) -> bool:
         """Определяет, нужно ли проверять изменения в чате"""
-        with sqlite3.connect(self.db_path) as conn:
-            result = conn.execute('''
-                SELECT MAX(timestamp) FROM message_history
-                WHERE chat_id = ? AND action_type IN ('created', 'edited', 'deleted')
-            ''', (chat_id,)).fetchone()
+        if chat_id in self._last_change_times:
+            last_change = self._last_change_times[chat_id]
+        else:
+            with self._connection() as conn:
+                result = conn.execute('''
+                    SELECT MAX(timestamp) FROM message_history
+                    WHERE chat_id = ? AND action_type IN ('created', 'edited', 'deleted')
+                ''', (chat_id,)).fetchone()
+
+            last_change = result[0] if result else None
+            self._last_change_times[chat_id] = last_change
 
-            if not result or not result[0]:
-                return True
+        if not last_change:
+            return True
 
-            from datetime import datetime, timedelta
-            last_check = datetime.fromisoformat(result[0])
-            threshold = datetime.now() - timedelta(hours=hours_threshold)
+        last_check = datetime.fromisoformat(last_change)
+        threshold = datetime.now() - timedelta(hours=hours_threshold)
 
-            return last_check < threshold
+        return last_check < threshold
 
     def get_parsing_statistics(self) -> Dict:
         """Получает статистику парсинга для мониторинга"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             conn.row_factory = sqlite3.Row
 
             # Общая статистика
@@ -385,7 +1041,7 @@ class TelegramDatabase:
                 SELECT
                     COUNT(DISTINCT chat_id) as total_chats,
                     COUNT(*) as total_messages,
-                    COUNT(CASE WHEN is_deleted = TRUE THEN 1 END) as deleted_messages
+                    COUNT(CASE WHEN is_deleted = 1 THEN 1 END) as deleted_messages
                 FROM messages
             ''').fetchone()
 
@@ -418,7 +1074,7 @@ class TelegramDatabase:
 
     def get_message_history(self, message_id: int, chat_id: int) -> List[Dict]:
         """Получает полную историю изменений конкретного сообщения"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             conn.row_factory = sqlite3.Row
             
             history = conn.execute('''
@@ -442,177 +1098,217 @@ class TelegramDatabase:
             
             return [dict(row) for row in history]
 
+    def iter_edited_messages(self, chat_id: int = None, limit: int = 100) -> Iterator[Dict]:
+        """
+        Построчно отдает отредактированные сообщения, не собирая весь результат в список.
+        Итератор нужно дочитать до конца или закрыть (close()): до этого
+        он занимает соединение из пула
+        """
+        query = '''
+            SELECT DISTINCT
+                m.id as message_id,
+                m.chat_id,
+                c.name as chat_name,
+                m.sender_id,
+                u.username,
+                u.first_name,
+                u.last_name,
+                m.date as message_date,
+                m.text as current_text,
+                COUNT(mh.id) as edit_count,
+                MAX(mh.timestamp) as last_edit_time
+            FROM messages m
+            JOIN message_history mh ON m.id = mh.message_id AND m.chat_id = mh.chat_id
+            JOIN chats c ON m.chat_id = c.id
+            LEFT JOIN users u ON m.sender_id = u.id
+            WHERE mh.action_type = 'edited'
+        '''
+
+        params = []
+        if chat_id:
+            query += ' AND m.chat_id = ?'
+            params.append(chat_id)
+
+        query += '''
+            GROUP BY m.id, m.chat_id
+            ORDER BY last_edit_time DESC
+            LIMIT ?
+        '''
+        params.append(limit)
+
+        yield from self._iter_rows(query, params)
+
     def get_edited_messages(self, chat_id: int = None, limit: int = 100) -> List[Dict]:
         """Получает список всех отредактированных сообщений"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            
-            query = '''
-                SELECT DISTINCT
-                    m.id as message_id,
-                    m.chat_id,
-                    c.name as chat_name,
-                    m.sender_id,
-                    u.username,
-                    u.first_name,
-                    u.last_name,
-                    m.date as message_date,
-                    m.text as current_text,
-                    COUNT(mh.id) as edit_count,
-                    MAX(mh.timestamp) as last_edit_time
-                FROM messages m
-                JOIN message_history mh ON m.id = mh.message_id AND m.chat_id = mh.chat_id
-                JOIN chats c ON m.chat_id = c.id
-                LEFT JOIN users u ON m.sender_id = u.id
-                WHERE mh.action_type = 'edited'
-            '''
-            
-            params = []
-            if chat_id:
-                query += ' AND m.chat_id = ?'
-                params.append(chat_id)
-                
-            query += '''
-                GROUP BY m.id, m.chat_id
-                ORDER BY last_edit_time DESC
-                LIMIT ?
-            '''
-            params.append(limit)
-            
-            messages = conn.execute(query, params).fetchall()
-            return [dict(row) for row in messages]
+        return list(self.iter_edited_messages(chat_id, limit))
+
+    def iter_deleted_messages(self, chat_id: int = None, limit: int = 100) -> Iterator[Dict]:
+        """
+        Построчно отдает удаленные сообщения, не собирая весь результат в список.
+        Итератор нужно дочитать до конца или закрыть (close()): до этого
+        он занимает соединение из пула
+        """
+        query = '''
+            SELECT
+                m.id as message_id,
+                m.chat_id,
+                c.name as chat_name,
+                m.sender_id,
+                u.username,
+                u.first_name,
+                u.last_name,
+                m.date as message_date,
+                mh.old_text as deleted_text,
+                mh.timestamp as deletion_time,
+                mh.scan_session
+            FROM messages m
+            JOIN message_history mh ON m.id = mh.message_id AND m.chat_id = mh.chat_id
+            JOIN chats c ON m.chat_id = c.id
+            LEFT JOIN users u ON m.sender_id = u.id
+            WHERE m.is_deleted = 1 AND mh.action_type = 'deleted'
+        '''
+
+        params = []
+        if chat_id:
+            query += ' AND m.chat_id = ?'
+            params.append(chat_id)
+
+        query += '''
+            ORDER BY mh.timestamp DESC
+            LIMIT ?
+        '''
+        params.append(limit)
+
+        yield from self._iter_rows(query, params)
 
     def get_deleted_messages(self, chat_id: int = None, limit: int = 100) -> List[Dict]:
         """Получает список всех удаленных сообщений"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            
-            query = '''
-                SELECT 
-                    m.id as message_id,
-                    m.chat_id,
-                    c.name as chat_name,
-                    m.sender_id,
-                    u.username,
-                    u.first_name,
-                    u.last_name,
-                    m.date as message_date,
-                    mh.old_text as deleted_text,
-                    mh.timestamp as deletion_time,
-                    mh.scan_session
-                FROM messages m
-                JOIN message_history mh ON m.id = mh.message_id AND m.chat_id = mh.chat_id
-                JOIN chats c ON m.chat_id = c.id
-                LEFT JOIN users u ON m.sender_id = u.id
-                WHERE m.is_deleted = TRUE AND mh.action_type = 'deleted'
-            '''
-            
-            params = []
-            if chat_id:
-                query += ' AND m.chat_id = ?'
-                params.append(chat_id)
-                
-            query += '''
-                ORDER BY mh.timestamp DESC
-                LIMIT ?
-            '''
-            params.append(limit)
-            
-            messages = conn.execute(query, params).fetchall()
-            return [dict(row) for row in messages]
+        return list(self.iter_deleted_messages(chat_id, limit))
+
+    def iter_message_changes_by_date(self, start_date: str = None, end_date: str = None,
+                                     action_type: str = None) -> Iterator[Dict]:
+        """
+        Построчно отдает изменения сообщений за период, не собирая весь результат в список.
+        Итератор нужно дочитать до конца или закрыть (close()): до этого
+        он занимает соединение из пула
+        """
+        query = '''
+            SELECT
+                mh.id,
+                mh.message_id,
+                mh.chat_id,
+                c.name as chat_name,
+                mh.action_type,
+                mh.old_text,
+                mh.new_text,
+                mh.timestamp,
+                m.sender_id,
+                u.username,
+                u.first_name,
+                u.last_name
+            FROM message_history mh
+            JOIN messages m ON mh.message_id = m.id AND mh.chat_id = m.chat_id
+            JOIN chats c ON mh.chat_id = c.id
+            LEFT JOIN users u ON m.sender_id = u.id
+            WHERE 1=1
+        '''
+
+        params = []
 
-    def get_message_changes_by_date(self, start_date: str = None, end_date: str = None, 
+        if start_date:
+            query += ' AND mh.timestamp >= ?'
+            params.append(start_date)
+
+        if end_date:
+            query += ' AND mh.timestamp <= ?'
+            params.append(end_date)
+
+        if action_type:
+            query += ' AND mh.action_type = ?'
+            params.append(action_type)
+
+        query += ' ORDER BY mh.timestamp DESC'
+
+        yield from self._iter_rows(query, params)
+
+    def get_message_changes_by_date(self, start_date: str = None, end_date: str = None,
                                     action_type: str = None) -> List[Dict]:
         """Получает изменения сообщений за определенный период"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            
-            query = '''
-                SELECT 
-                    mh.id,
-                    mh.message_id,
-                    mh.chat_id,
-                    c.name as chat_name,
-                    mh.action_type,
-                    mh.old_text,
-                    mh.new_text,
-                    mh.timestamp,
-                    m.sender_id,
-                    u.username,
-                    u.first_name,
-                    u.last_name
-                FROM message_history mh
-                JOIN messages m ON mh.message_id = m.id AND mh.chat_id = m.chat_id
-                JOIN chats c ON mh.chat_id = c.id
-                LEFT JOIN users u ON m.sender_id = u.id
-                WHERE 1=1
-            '''
-            
-            params = []
-            
-            if start_date:
-                query += ' AND mh.timestamp >= ?'
-                params.append(start_date)
-                
-            if end_date:
-                query += ' AND mh.timestamp <= ?'
-                params.append(end_date)
-                
-            if action_type:
-                query += ' AND mh.action_type = ?'
-                params.append(action_type)
-                
-            query += ' ORDER BY mh.timestamp DESC'
-            
-            changes = conn.execute(query, params).fetchall()
-            return [dict(row) for row in changes]
+        return list(self.iter_message_changes_by_date(start_date, end_date, action_type))
+
+    def _iter_rows(self, query: str, params) -> Iterator[Dict]:
+        """
+        Выполняет запрос и отдает строки словарями по мере чтения курсора.
+        row_factory задается курсору, а не соединению потока, поэтому другие
+        запросы во время обхода его не сбрасывают. Соединение из пула занято,
+        пока итератор не дочитан или не закрыт: брошенный недочитанным
+        итератор держит его, и остальные вызовы ждут свободного соединения
+        не дольше таймаута пула
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            for row in cursor.execute(query, params):
+                yield dict(row)
 
     def get_chat_change_statistics(self, chat_id: int) -> Dict:
         """Получает статистику изменений для конкретного чата"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            
-            # Статистика по типам изменений
-            change_stats = conn.execute('''
-                SELECT 
-                    action_type,
-                    COUNT(*) as count
-                FROM message_history
-                WHERE chat_id = ?
-                GROUP BY action_type
-            ''', (chat_id,)).fetchall()
-            
-            # Самые редактируемые сообщения
-            most_edited = conn.execute('''
-                SELECT 
-                    message_id,
-                    COUNT(*) as edit_count,
-                    m.text as current_text,
-                    m.sender_id,
-                    u.username
-                FROM message_history mh
-                JOIN messages m ON mh.message_id = m.id AND mh.chat_id = m.chat_id
-                LEFT JOIN users u ON m.sender_id = u.id
-                WHERE mh.chat_id = ? AND mh.action_type = 'edited'
-                GROUP BY message_id
-                ORDER BY edit_count DESC
-                LIMIT 10
-            ''', (chat_id,)).fetchall()
-            
-            # Активность по дням
-            daily_activity = conn.execute('''
-                SELECT 
-                    DATE(timestamp) as date,
-                    action_type,
-                    COUNT(*) as count
-                FROM message_history
-                WHERE chat_id = ? AND timestamp > datetime('now', '-30 days')
-                GROUP BY DATE(timestamp), action_type
-                ORDER BY date DESC
-            ''', (chat_id,)).fetchall()
-            
-            return {
-                'change_statistics': [dict(row) for row in change_stats],
-                'most_edited_messages': [dict(row) for row in most_edited],
-                'daily_activity': [dict(row) for row in daily_activity]
-            }
\ No newline at end of file
+        with self._connection() as conn:
+            # Все три списка собираются в JSON средствами SQLite за один запрос
+            # и разбираются одним json.loads, без построчного создания словарей
+            result = conn.execute('''
+                SELECT json_object(
+                    -- Статистика по типам изменений
+                    'change_statistics', (
+                        SELECT json_group_array(json_object(
+                            'action_type', action_type, 'count', count))
+                        FROM (
+                            SELECT
+                                action_type,
+                                COUNT(*) as count
+                            FROM message_history
+                            WHERE chat_id = :chat_id
+                            GROUP BY action_type
+                        )
+                    ),
+                    -- Самые редактируемые сообщения
+                    'most_edited_messages', (
+                        SELECT json_group_array(json_object(
+                            'message_id', message_id, 'edit_count', edit_count,
+                            'current_text', current_text, 'sender_id', sender_id,
+                            'username', username))
+                        FROM (
+                            SELECT
+                                message_id,
+                                COUNT(*) as edit_count,
+                                m.text as current_text,
+                                m.sender_id,
+                                u.username
+                            FROM message_history mh
+                            JOIN messages m ON mh.message_id = m.id AND mh.chat_id = m.chat_id
+                            LEFT JOIN users u ON m.sender_id = u.id
+                            WHERE mh.chat_id = :chat_id AND mh.action_type = 'edited'
+                            GROUP BY message_id
+                            ORDER BY edit_count DESC
+                            LIMIT 10
+                        )
+                    ),
+                    -- Активность по дням
+                    'daily_activity', (
+                        SELECT json_group_array(json_object(
+                            'date', date, 'action_type', action_type, 'count', count))
+                        FROM (
+                            SELECT
+                                DATE(timestamp) as date,
+                                action_type,
+                                COUNT(*) as count
+                            FROM message_history
+                            WHERE chat_id = :chat_id AND timestamp > datetime('now', '-30 days')
+                            GROUP BY DATE(timestamp), action_type
+                            ORDER BY date DESC
+                        )
+                    )
+                )
+            ''', {'chat_id': chat_id}).fetchone()
+
+            return json.loads(result[0])
\ No newline at end of file
@@ -3,6 +3,7 @@
 """
 from database import TelegramDatabase
 from datetime import datetime, timedelta
+from html import escape
 import json
 
 def view_message_changes_demo():
@@ -59,7 +60,7 @@ def view_message_changes_demo():
     # 4. Получение изменений за последние 7 дней
     print("\n\n4. Изменения за последние 7 дней:")
     week_ago = (datetime.now() - timedelta(days=7)).isoformat()
-    recent_changes = db.get_message_changes_by_date(start_date=week_ago)
+    recent_changes = db.iter_message_changes_by_date(start_date=week_ago)
     
     # Группируем по типу действия
     changes_by_type = {}
@@ -89,15 +90,44 @@ def view_message_changes_demo():
             print(f"    Автор: {msg.get('username', 'Unknown')}")
             print(f"    Текст: {msg['current_text'][:50]}...")
 
+def _edited_rows(messages):
+    """Строки таблицы отредактированных сообщений"""
+    for msg in messages:
+        yield f"""
+        <tr class="edited">
+            <td>{msg['message_id']}</td>
+            <td>{escape(str(msg['chat_name']))}</td>
+            <td>{escape(str(msg.get('username') or msg.get('first_name', 'Unknown')))}</td>
+            <td>{msg['message_date']}</td>
+            <td>{msg['edit_count']}</td>
+            <td>{msg['last_edit_time']}</td>
+            <td class="message-text">{escape(msg['current_text'] or '')}</td>
+        </tr>
+"""
+
+def _deleted_rows(messages):
+    """Строки таблицы удаленных сообщений"""
+    for msg in messages:
+        yield f"""
+        <tr class="deleted">
+            <td>{msg['message_id']}</td>
+            <td>{escape(str(msg['chat_name']))}</td>
+            <td>{escape(str(msg.get('username') or msg.get('first_name', 'Unknown')))}</td>
+            <td>{msg['message_date']}</td>
+            <td>{msg['deletion_time']}</td>
+            <td class="message-text">{escape(msg['deleted_text'] or 'N/A')}</td>
+        </tr>
+"""
+
 def create_html_report():
     """Создание HTML отчета с изменениями"""
     db = TelegramDatabase()
     
-    # Получаем данные
-    edited = db.get_edited_messages(limit=50)
-    deleted = db.get_deleted_messages(limit=50)
-    
-    html = """
+    # Отчет пишется в файл по мере чтения строк из базы,
+    # целиком в памяти он не собирается
+    report_path = 'output/message_changes_report.html'
+    with open(report_path, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        f.write("""
 <!DOCTYPE html>
 <html>
 <head>
@@ -117,7 +147,7 @@ def create_html_report():
 </head>
 <body>
     <h1>История изменений сообщений Telegram</h1>
-    <p>Отчет создан: {}</p>
+    <p>Отчет создан: """ + datetime.now().strftime('%Y-%m-%d %H:%M:%S') + """</p>
     
     <h2>Отредактированные сообщения</h2>
     <table>
@@ -130,22 +160,10 @@ def create_html_report():
             <th>Последнее изменение</th>
             <th>Текущий текст</th>
         </tr>
-""".format(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-    
-    for msg in edited:
-        html += f"""
-        <tr class="edited">
-            <td>{msg['message_id']}</td>
-            <td>{msg['chat_name']}</td>
-            <td>{msg.get('username') or msg.get('first_name', 'Unknown')}</td>
-            <td>{msg['message_date']}</td>
-            <td>{msg['edit_count']}</td>
-            <td>{msg['last_edit_time']}</td>
-            <td class="message-text">{msg['current_text']}</td>
-        </tr>
-"""
-    
-    html += """
+""")
+        f.writelines(_edited_rows(db.iter_edited_messages(limit=50)))
+        
+        f.write("""
     </table>
     
     <h2>Удаленные сообщения</h2>
@@ -158,30 +176,14 @@ def create_html_report():
             <th>Удалено</th>
             <th>Текст сообщения</th>
         </tr>
-"""
-    
-    for msg in deleted:
-        html += f"""
-        <tr class="deleted">
-            <td>{msg['message_id']}</td>
-            <td>{msg['chat_name']}</td>
-            <td>{msg.get('username') or msg.get('first_name', 'Unknown')}</td>
-            <td>{msg['message_date']}</td>
-            <td>{msg['deletion_time']}</td>
-            <td class="message-text">{msg['deleted_text'] or 'N/A'}</td>
-        </tr>
-"""
-    
-    html += """
+""")
+        f.writelines(_deleted_rows(db.iter_deleted_messages(limit=50)))
+        
+        f.write("""
     </table>
 </body>
 </html>
-"""
-    
-    # Сохраняем отчет
-    report_path = 'output/message_changes_report.html'
-    with open(report_path, 'w', encoding='utf-8') as f:
-        f.write(html)
+""")
     
     print(f"HTML отчет сохранен: {report_path}")
 
@@ -1,27 +1,80 @@
 """
 Утилиты для работы с JSON и сериализацией данных
 """
+import base64
 import json
 from datetime import datetime, date
 from typing import Any
 
+try:
+    import orjson
+except ImportError:  # orjson опционален, без него используем стандартный json
+    orjson = None
+
+
+def _convert_object(obj):
+    """
+    Приводит объект, который JSON не сериализует напрямую, к простому значению
+    
+    Объекты Telethon отдают словарь через to_dict() - это дешевле, чем str(obj),
+    который рекурсивно обходит весь граф атрибутов объекта
+    """
+    if isinstance(obj, bytes):
+        # bytes встречаются в to_dict() Telethon (file_reference и т.п.)
+        return base64.b64encode(obj).decode('ascii')
+    to_dict = getattr(obj, 'to_dict', None)
+    if callable(to_dict):
+        return to_dict()
+    if hasattr(obj, '__dict__'):
+        # Для прочих объектов
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
 
 class DateTimeEncoder(json.JSONEncoder):
-    """Кастомный JSON энкодер с поддержкой datetime объектов"""
+    """Кастомный JSON энкодер с поддержкой datetime объектов и объектов Telethon"""
     
     def default(self, obj):
         if isinstance(obj, (datetime, date)):
             return obj.isoformat()
-        elif hasattr(obj, '__dict__'):
-            # Для объектов Telethon и других
-            return str(obj)
-        return super().default(obj)
+        return _convert_object(obj)
+
+
+# Энкодер для вызовов без дополнительных параметров создается один раз
+_default_encoder = DateTimeEncoder(ensure_ascii=False)
+
+
+def _orjson_default(obj):
+    """Объекты Telethon и другие сериализуем так же, как DateTimeEncoder"""
+    return _convert_object(obj)
+
+
+def safe_json_dumps_bytes(data: Any) -> bytes:
+    """
+    Сериализация в компактный JSON в кодировке UTF-8 (через orjson, если установлен)
+    
+    Args:
+        data: Данные для сериализации
+        
+    Returns:
+        bytes: JSON в UTF-8
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Числа больше 64 бит и строки с суррогатами orjson не сериализует
+            pass
+    return _default_encoder.encode(data).encode('utf-8')
 
 
 def safe_json_dumps(data: Any, **kwargs) -> str:
     """
     Безопасная сериализация в JSON с поддержкой datetime
     
+    Без дополнительных параметров используется orjson (если установлен),
+    результат - компактный JSON
+    
     Args:
         data: Данные для сериализации
         **kwargs: Дополнительные параметры для json.dumps
@@ -29,7 +82,15 @@ def safe_json_dumps(data: Any, **kwargs) -> str:
     Returns:
         str: JSON строка
     """
-    return json.dumps(data, cls=DateTimeEncoder, ensure_ascii=False, **kwargs)
+    if kwargs:
+        return json.dumps(data, cls=DateTimeEncoder, ensure_ascii=False, **kwargs)
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        except TypeError:
+            # Числа больше 64 бит и строки с суррогатами orjson не сериализует
+            pass
+    return _default_encoder.encode(data)
 
 
 def safe_json_loads(data: str) -> Any:
@@ -1,16 +1,21 @@
 """
 Конфигурация логирования для Telegram Parser
 """
+import atexit
 import logging
 import os
+import queue
 from datetime import datetime
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 # Создаем директорию для логов если её нет
 LOGS_DIR = "logs"
 if not os.path.exists(LOGS_DIR):
     os.makedirs(LOGS_DIR)
 
+# Фоновые слушатели очередей логов, останавливаются в shutdown_loggers()
+_listeners = []
+
 def setup_logger(name, log_file, level=logging.INFO):
     """Настройка логгера с ротацией файлов"""
     
@@ -34,11 +39,20 @@ def setup_logger(name, log_file, level=logging.INFO):
     console_handler.setLevel(logging.ERROR)
     console_handler.setFormatter(formatter)
     
+    # Запись в файл и консоль выполняется в фоновом потоке слушателя,
+    # рабочий поток только кладет запись в очередь
+    log_queue = queue.Queue(-1)
+    listener = QueueListener(log_queue, file_handler, console_handler,
+                             respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    
     # Настраиваем логгер
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    logger.addHandler(QueueHandler(log_queue))
+    # Записи не дублируются через обработчики корневого логгера
+    logger.propagate = False
     
     return logger
 
@@ -48,6 +62,13 @@ web_logger = setup_logger('web', 'web_interface.log')
 monitor_logger = setup_logger('monitor', 'monitor.log')
 error_logger = setup_logger('errors', 'errors.log', logging.ERROR)
 
+# Логгер компонента выбирается одним поиском в словаре
+_COMPONENT_LOGGERS = {
+    'parser': parser_logger,
+    'web': web_logger,
+    'monitor': monitor_logger,
+}
+
 def log_error(component, error, context=None):
     """Логирование ошибки с контекстом"""
     error_msg = f"[{component}] {error}"
@@ -57,27 +78,28 @@ def log_error(component, error, context=None):
     error_logger.error(error_msg, exc_info=True)
     
     # Также логируем в компонентный логгер
-    if component == 'parser':
-        parser_logger.error(error_msg)
-    elif component == 'web':
-        web_logger.error(error_msg)
-    elif component == 'monitor':
-        monitor_logger.error(error_msg)
+    logger = _COMPONENT_LOGGERS.get(component)
+    if logger:
+        logger.error(error_msg)
 
 def log_info(component, message):
     """Логирование информационного сообщения"""
-    if component == 'parser':
-        parser_logger.info(message)
-    elif component == 'web':
-        web_logger.info(message)
-    elif component == 'monitor':
-        monitor_logger.info(message)
+    logger = _COMPONENT_LOGGERS.get(component)
+    if logger:
+        logger.info(message)
 
 def log_warning(component, message):
     """Логирование предупреждения"""
-    if component == 'parser':
-        parser_logger.warning(message)
-    elif component == 'web':
-        web_logger.warning(message)
-    elif component == 'monitor':
-        monitor_logger.warning(message)
\ No newline at end of file
+    logger = _COMPONENT_LOGGERS.get(component)
+    if logger:
+        logger.warning(message)
+
+def shutdown_loggers():
+    """Останавливает фоновые слушатели, дописав оставшиеся записи"""
+    while _listeners:
+        listener = _listeners.pop()
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+atexit.register(shutdown_loggers)
\ No newline at end of file
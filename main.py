@@ -219,6 +219,7 @@ async def parse_single_chat(parser: TelegramParser, exporter: DataExporter):
                     print("\n🤖 Создаем AI анализ...")
                     ai_exp = AIExporter(parser.db.db_path)
                     ai_files = ai_exp.create_complete_ai_package(selected_chat['id'])
+                    ai_exp.close()
                     print("✅ AI анализ создан автоматически!")
 
             except (KeyboardInterrupt, asyncio.CancelledError):
@@ -302,6 +303,7 @@ async def parse_all_chats(parser: TelegramParser, exporter: DataExporter):
             print("\n🤖 Создаем общий AI анализ...")
             ai_exp = AIExporter(parser.db.db_path)
             ai_files = ai_exp.create_complete_ai_package()
+            ai_exp.close()
             print("✅ AI анализ создан автоматически!")
 
     except (KeyboardInterrupt, asyncio.CancelledError):
@@ -3,12 +3,15 @@
 Отслеживает редактирование и удаление сообщений через Telegram API
 """
 import asyncio
+import json
 import logging
+import sqlite3
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, Iterator, List, Tuple
 from telethon import TelegramClient, events
 from telethon.tl.types import MessageMediaDocument, MessageMediaPhoto
-from database import TelegramDatabase
+from database import ConnectionPool, TelegramDatabase, connect_db
 import config
 from notification_manager import get_notification_manager
 from json_utils import safe_json_dumps
@@ -29,6 +32,9 @@ file_handler.setFormatter(formatter)
 # Добавляем обработчик к логгеру
 logger.addHandler(file_handler)
 
+# Сколько соединений с БД держит монитор
+_POOL_SIZE = 4
+
 
 class RealtimeMonitor:
     """Класс для мониторинга изменений сообщений в реальном времени"""
@@ -39,6 +45,12 @@ class RealtimeMonitor:
         self.is_running = False
         self.monitored_chats: List[int] = []
         self.callbacks = []  # Список callback функций для уведомлений
+        self._changes_log_ready = False  # Таблица лога изменений уже создана
+        # Ограниченный пул соединений: статистику и недавние изменения
+        # веб-интерфейс запрашивает из потоков запросов
+        self._pool = ConnectionPool(
+            lambda: connect_db(self.db.db_path, check_same_thread=False), _POOL_SIZE
+        )
         
         # Регистрируем обработчики событий
         self._register_handlers()
@@ -60,6 +72,9 @@ class RealtimeMonitor:
                 # Логируем изменение
                 logger.info(f"Message edited in chat {event.chat_id}: {event.message.id}")
                 
+                # Информация о чате нужна и для БД, и для уведомления: запрашиваем один раз
+                chat_name = (await self._get_chat_info(event.chat_id)).get('name', 'Unknown')
+                
                 # Сохраняем в БД
                 if self.db:
                     await self._log_message_change(
@@ -67,7 +82,8 @@ class RealtimeMonitor:
                         message_id=event.message.id,
                         action_type='edited',
                         old_content=None,  # Старое содержимое берется из БД
-                        new_content=message_data
+                        new_content=message_data,
+                        chat_name=chat_name
                     )
                 
                 # Вызываем callbacks
@@ -83,7 +99,7 @@ class RealtimeMonitor:
                 notification_manager = get_notification_manager()
                 notification_manager.notify('message_edited', {
                     'chat_id': event.chat_id,
-                    'chat_name': (await self._get_chat_info(event.chat_id)).get('name', 'Unknown'),
+                    'chat_name': chat_name,
                     'message_id': event.message.id,
                     'text': message_data.get('text', '')[:100] + ('...' if message_data.get('text', '') and len(message_data.get('text', '')) > 100 else '')
                 })
@@ -103,19 +119,25 @@ class RealtimeMonitor:
                     return
                 
                 # Для удаленных сообщений у нас есть только ID
-                for message_id in event.deleted_ids:
+                deleted_ids = list(event.deleted_ids)
+                
+                # Информация о чате и менеджер уведомлений общие для всех ID события
+                chat_name = (await self._get_chat_info(event.chat_id)).get('name', 'Unknown')
+                notification_manager = get_notification_manager()
+                
+                # Сохраняем в БД одной транзакцией на всё событие,
+                # старое содержимое берется из БД
+                if self.db:
+                    await self._log_message_changes(
+                        chat_id=event.chat_id,
+                        action_type='deleted',
+                        changes=[(message_id, None, None) for message_id in deleted_ids],
+                        chat_name=chat_name
+                    )
+                
+                for message_id in deleted_ids:
                     logger.info(f"Message deleted in chat {event.chat_id}: {message_id}")
                     
-                    # Сохраняем в БД
-                    if self.db:
-                        await self._log_message_change(
-                            chat_id=event.chat_id,
-                            message_id=message_id,
-                            action_type='deleted',
-                            old_content=None,  # Берется из БД
-                            new_content=None
-                        )
-                    
                     # Вызываем callbacks
                     await self._notify_callbacks('message_deleted', {
                         'chat_id': event.chat_id,
@@ -124,10 +146,9 @@ class RealtimeMonitor:
                     })
                     
                     # Отправляем уведомление через менеджер
-                    notification_manager = get_notification_manager()
                     notification_manager.notify('message_deleted', {
                         'chat_id': event.chat_id,
-                        'chat_name': (await self._get_chat_info(event.chat_id)).get('name', 'Unknown'),
+                        'chat_name': chat_name,
                         'message_id': message_id
                     })
                     
@@ -161,53 +182,89 @@ class RealtimeMonitor:
         
         return data
     
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Отдает соединение из пула на время блока.
+        Изменения фиксируются при выходе из блока, при ошибке откатываются
+        """
+        with self._pool.connection() as conn:
+            with conn:
+                yield conn
+    
     async def _log_message_change(self, chat_id: int, message_id: int, 
                                  action_type: str, old_content: Optional[Dict], 
-                                 new_content: Optional[Dict]):
+                                 new_content: Optional[Dict], chat_name: Optional[str] = None):
         """Сохраняет изменение в базу данных"""
+        await self._log_message_changes(chat_id, action_type, [(message_id, old_content, new_content)],
+                                        chat_name=chat_name)
+    
+    async def _log_message_changes(self, chat_id: int, action_type: str,
+                                   changes: List[Tuple[int, Optional[Dict], Optional[Dict]]],
+                                   chat_name: Optional[str] = None):
+        """
+        Сохраняет пачку изменений одного чата в базу данных одной транзакцией.
+        Имя чата запрашивается у Telegram, только если его не передали
+        """
+        if not changes:
+            return
+        
         try:
             # Создаем таблицу для логирования если её нет
             await self._ensure_changes_log_table()
             
-            # Получаем старое содержимое из БД если не передано
-            if old_content is None and action_type in ['edited', 'deleted']:
-                old_content = await self._get_message_from_db(chat_id, message_id)
-            
-            # Сохраняем запись об изменении
-            query = """
-            INSERT INTO realtime_changes_log 
-            (chat_id, message_id, action_type, old_content, new_content, 
-             detected_at, user_id, chat_name)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """
-            
-            # Получаем информацию о чате
-            chat_info = await self._get_chat_info(chat_id)
+            # Получаем информацию о чате один раз на пачку
+            if chat_name is None:
+                chat_name = (await self._get_chat_info(chat_id)).get('name', 'Unknown')
+            detected_at = datetime.now().isoformat()
             
-            import sqlite3
+            # Старое содержимое, которое не передали, берем из БД одним запросом на пачку
+            stored_messages = {}
+            if action_type in ['edited', 'deleted']:
+                missing_ids = [message_id for message_id, old_content, _ in changes if old_content is None]
+                if missing_ids:
+                    stored_messages = await self._get_messages_from_db(chat_id, missing_ids)
             
-            with sqlite3.connect(self.db.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(query, (
+            rows = []
+            for message_id, old_content, new_content in changes:
+                if old_content is None:
+                    old_content = stored_messages.get(message_id)
+                
+                rows.append((
                     chat_id,
                     message_id,
                     action_type,
                     safe_json_dumps(old_content) if old_content else None,
                     safe_json_dumps(new_content) if new_content else None,
-                    datetime.now().isoformat(),
+                    detected_at,
                     new_content.get('from_id') if new_content else 
                         old_content.get('from_id') if old_content else None,
-                    chat_info.get('name', 'Unknown')
+                    chat_name
                 ))
-                conn.commit()
+            
+            # Сохраняем записи об изменениях: один подготовленный запрос и один commit
+            query = """
+            INSERT INTO realtime_changes_log 
+            (chat_id, message_id, action_type, old_content, new_content, 
+             detected_at, user_id, chat_name)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """
+            
+            with self._connection() as conn:
+                conn.executemany(query, rows)
                 
-            logger.info(f"Logged {action_type} for message {message_id} in chat {chat_id}")
+            for row in rows:
+                logger.info(f"Logged {action_type} for message {row[1]} in chat {chat_id}")
             
         except Exception as e:
             logger.error(f"Error logging message change: {e}")
     
     async def _ensure_changes_log_table(self):
         """Создает таблицу для логирования изменений если её нет"""
+        # Схема не меняется за время работы процесса: проверяем один раз
+        if self._changes_log_ready:
+            return
+
         query = """
         CREATE TABLE IF NOT EXISTS realtime_changes_log (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -223,41 +280,44 @@ class RealtimeMonitor:
         )
         """
         
-        import sqlite3
-        with sqlite3.connect(self.db.db_path) as conn:
+        with self._connection() as conn:
             conn.execute(query)
             
-            # Создаем индексы
+            # Создаем индексы: (chat_id, detected_at) отдает изменения чата
+            # за период уже упорядоченными и заменяет индекс по одному chat_id
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_realtime_changes_chat_id 
-                ON realtime_changes_log(chat_id)
+                CREATE INDEX IF NOT EXISTS idx_realtime_changes_chat_detected 
+                ON realtime_changes_log(chat_id, detected_at)
             """)
+            conn.execute("DROP INDEX IF EXISTS idx_realtime_changes_chat_id")
             conn.execute("""
                 CREATE INDEX IF NOT EXISTS idx_realtime_changes_detected_at 
                 ON realtime_changes_log(detected_at)
             """)
             conn.commit()
+
+        self._changes_log_ready = True
     
-    async def _get_message_from_db(self, chat_id: int, message_id: int) -> Optional[Dict]:
-        """Получает сообщение из базы данных"""
+    async def _get_messages_from_db(self, chat_id: int, message_ids: List[int]) -> Dict[int, Dict]:
+        """Получает сообщения чата из базы данных одним запросом: {message_id: сообщение}"""
         try:
-            import sqlite3
-            with sqlite3.connect(self.db.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._connection() as conn:
                 cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
                 
-                result = cursor.execute("""
+                # Список ID передается одним JSON-параметром: текст запроса
+                # не зависит от размера пачки и не упирается в лимит параметров
+                results = cursor.execute("""
                     SELECT * FROM messages 
-                    WHERE chat_id = ? AND id = ?
-                """, (chat_id, message_id)).fetchone()
+                    WHERE chat_id = ? AND id IN (SELECT value FROM json_each(?))
+                """, (chat_id, json.dumps(message_ids))).fetchall()
                 
-                if result:
-                    return dict(result)
+                return {row['id']: dict(row) for row in results}
                 
         except Exception as e:
             logger.error(f"Error getting message from DB: {e}")
         
-        return None
+        return {}
     
     async def _get_chat_info(self, chat_id: int) -> Dict[str, Any]:
         """Получает информацию о чате"""
@@ -311,6 +371,7 @@ class RealtimeMonitor:
     def stop_monitoring(self):
         """Останавливает мониторинг"""
         self.is_running = False
+        self._pool.close()
         logger.info("Stopped monitoring")
         
         # Обновляем статус в файле
@@ -319,9 +380,6 @@ class RealtimeMonitor:
     async def get_recent_changes(self, hours: int = 24, chat_id: Optional[int] = None) -> List[Dict]:
         """Получает недавние изменения из лога"""
         try:
-            import sqlite3
-            from datetime import timedelta
-            
             since = (datetime.now() - timedelta(hours=hours)).isoformat()
             
             query = """
@@ -336,16 +394,15 @@ class RealtimeMonitor:
             
             query += " ORDER BY detected_at DESC"
             
-            with sqlite3.connect(self.db.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._connection() as conn:
                 cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
                 results = cursor.execute(query, params).fetchall()
                 
                 changes = []
                 for row in results:
                     change = dict(row)
                     # Парсим JSON поля
-                    import json
                     if change['old_content']:
                         change['old_content'] = json.loads(change['old_content'])
                     if change['new_content']:
@@ -361,16 +418,9 @@ class RealtimeMonitor:
     async def get_statistics(self) -> Dict[str, Any]:
         """Получает статистику по изменениям"""
         try:
-            import sqlite3
-            
-            with sqlite3.connect(self.db.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 
-                # Общая статистика
-                total_changes = cursor.execute(
-                    "SELECT COUNT(*) FROM realtime_changes_log"
-                ).fetchone()[0]
-                
                 # По типам
                 by_type = cursor.execute("""
                     SELECT action_type, COUNT(*) as count 
@@ -378,6 +428,9 @@ class RealtimeMonitor:
                     GROUP BY action_type
                 """).fetchall()
                 
+                # Общая статистика: сумма по типам, без отдельного прохода по таблице
+                total_changes = sum(count for _, count in by_type)
+                
                 # Топ чатов по изменениям
                 top_chats = cursor.execute("""
                     SELECT chat_name, chat_id, COUNT(*) as count 
@@ -406,6 +406,7 @@ class TelegramParser:
 
         messages = []
         current_message_ids = []
+        senders = {}
         new_count = 0
         total_checked = 0
 
@@ -427,9 +428,9 @@ class TelegramParser:
                     # Добавляем задержку для соблюдения лимитов
                     await asyncio.sleep(self.rate_limits.get('delay_between_requests', 0.5))
 
-                    # Сохраняем информацию об отправителе
+                    # Собираем информацию об отправителях, сохраняем пачкой
                     if message.sender and self.db:
-                        await self._save_user_info(message.sender)
+                        self._collect_user_info(senders, message.sender)
 
                     message_data = {
                         'id': message.id,
@@ -447,21 +448,29 @@ class TelegramParser:
                     current_message_ids.append(message.id)
                     new_count += 1
 
-                    # Сохраняем в БД с отслеживанием изменений
+                    # Ставим в очередь фоновой записи в БД с отслеживанием изменений
                     if self.db and session_id:
-                        self.db.save_message_with_history(message_data, session_id)
+                        self.db.queue_message_save(message_data, session_id)
+
+            # Сообщения считаются сохраненными, когда писатель их записал
+            if self.db and session_id:
+                self.db.flush_writes()
+            self.session_stats['messages_saved'] = self.session_stats.get('messages_saved', 0) + new_count
 
         except Exception as e:
             print(f"❌ Ошибка при парсинге новых сообщений: {e}")
             self.session_stats['errors'] += 1
 
+        if senders:
+            self.db.save_users_batch(list(senders.values()))
+
         print(f"✅ Найдено {new_count} новых сообщений из {total_checked} проверенных")
         
         # Финальное обновление статуса
         self.update_status(
             progress_update={
                 'parsing_phase': f'Завершено: {new_count} новых из {total_checked} проверенных',
-                'messages_saved': self.session_stats.get('messages_saved', 0) + new_count
+                'messages_saved': self.session_stats.get('messages_saved', 0)
             }
         )
         
@@ -486,6 +495,7 @@ class TelegramParser:
 
         messages = []
         current_message_ids = []
+        senders = {}
 
         try:
             message_count = 0
@@ -505,9 +515,9 @@ class TelegramParser:
                     # Добавляем задержку для соблюдения лимитов
                     await asyncio.sleep(self.rate_limits.get('delay_between_requests', 0.5))
 
-                    # Сохраняем информацию об отправителе
+                    # Собираем информацию об отправителях, сохраняем пачкой
                     if message.sender and self.db:
-                        await self._save_user_info(message.sender)
+                        self._collect_user_info(senders, message.sender)
 
                     message_data = {
                         'id': message.id,
@@ -524,12 +534,14 @@ class TelegramParser:
                     messages.append(message_data)
                     current_message_ids.append(message.id)
 
-                    # Сохраняем в БД с отслеживанием изменений
+                    # Ставим в очередь фоновой записи в БД с отслеживанием изменений
                     if self.db and session_id:
-                        self.db.save_message_with_history(message_data, session_id)
-                        
-                    # Обновляем статистику сессии
-                    self.session_stats['messages_saved'] = self.session_stats.get('messages_saved', 0) + 1
+                        self.db.queue_message_save(message_data, session_id)
+
+            # Сообщения считаются сохраненными, когда писатель их записал
+            if self.db and session_id:
+                self.db.flush_writes()
+            self.session_stats['messages_saved'] = self.session_stats.get('messages_saved', 0) + len(messages)
 
             # Помечаем удаленные сообщения
             if self.db and session_id:
@@ -541,6 +553,9 @@ class TelegramParser:
             print(f"❌ Ошибка при полном сканировании: {e}")
             self.session_stats['errors'] += 1
 
+        if senders:
+            self.db.save_users_batch(list(senders.values()))
+
         print(f"✅ Спарсили {len(messages)} сообщений")
         return messages
 
@@ -785,23 +800,18 @@ class TelegramParser:
 
         return all_data
 
-    async def _save_user_info(self, user):
-        """Сохраняет информацию о пользователе"""
-        if not isinstance(user, User) or not self.db:
+    def _collect_user_info(self, senders: Dict[int, Dict], user):
+        """Добавляет информацию о пользователе в пачку для сохранения"""
+        if not isinstance(user, User) or user.id in senders:
             return
 
-        import sqlite3
-        with sqlite3.connect(self.db.db_path) as conn:
-            conn.execute('''
-                INSERT OR IGNORE INTO users (id, username, first_name, last_name, phone)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                user.id,
-                getattr(user, 'username', None),
-                getattr(user, 'first_name', None),
-                getattr(user, 'last_name', None),
-                getattr(user, 'phone', None)
-            ))
+        senders[user.id] = {
+            'id': user.id,
+            'username': getattr(user, 'username', None),
+            'first_name': getattr(user, 'first_name', None),
+            'last_name': getattr(user, 'last_name', None),
+            'phone': getattr(user, 'phone', None)
+        }
 
     async def close(self):
         """Закрываем соединение с выводом статистики"""
@@ -814,6 +824,15 @@ class TelegramParser:
             await self.client.disconnect()
             print("👋 Отключились от Telegram")
 
+        # Закрываем соединения с базой данных
+        if self.db:
+            try:
+                self.db.close()
+            except Exception as e:
+                # Ошибка фоновой записи последних пачек
+                print(f"❌ Ошибка записи сообщений в БД: {e}")
+                self.session_stats['errors'] += 1
+
         # Выводим финальную статистику сессии
         stats = self.get_session_statistics()
         print(f"\n📊 Статистика сессии:")
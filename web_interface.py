@@ -141,7 +141,7 @@ def get_sync_status():
                     MAX(date) as last_message,
                     COUNT(*) as total_messages
                 FROM messages
-                WHERE is_deleted = FALSE
+                WHERE is_deleted = 0
             ''').fetchone()
             
             if not last_session and not chat_updates:
@@ -183,7 +183,7 @@ def get_chat_sync_status(chat_id):
                     COUNT(*) as total_messages,
                     MAX(created_at) as last_sync
                 FROM messages
-                WHERE chat_id = ? AND is_deleted = FALSE
+                WHERE chat_id = ? AND is_deleted = 0
             ''', (chat_id,)).fetchone()
             
             # Получаем количество изменений за последние 24 часа
@@ -538,7 +538,7 @@ def api_search():
                 LEFT JOIN chats c ON m.chat_id = c.id
                 LEFT JOIN users u ON m.sender_id = u.id
                 WHERE m.text LIKE ?
-                AND m.is_deleted = FALSE
+                AND m.is_deleted = 0
             '''
             
             params = [f'%{query}%']
@@ -745,7 +745,7 @@ def user_messages(chat_id, user_id):
                     MAX(date) as last_message,
                     COUNT(DISTINCT DATE(date)) as active_days
                 FROM messages
-                WHERE chat_id = ? AND sender_id = ? AND is_deleted = FALSE
+                WHERE chat_id = ? AND sender_id = ? AND is_deleted = 0
             ''', (chat_id, user_id)).fetchone()
         
         # Вычисляем пагинацию
@@ -1003,29 +1003,35 @@ def api_check_for_changes():
         # Получаем последние изменения из БД
         start_date = (datetime.now() - timedelta(hours=hours_threshold)).isoformat()
         
-        # Получаем изменения за период
-        changes = db.get_message_changes_by_date(
+        # Получаем изменения за период потоком: считаем статистику на лету
+        # и храним только последние 100 изменений для ответа
+        changes = []
+        total_changes = edited_count = deleted_count = 0
+        for change in db.iter_message_changes_by_date(
             start_date=start_date,
             action_type=None  # Все типы изменений
-        )
-        
-        # Фильтруем по chat_id если указан
-        if chat_id:
-            changes = [c for c in changes if c.get('chat_id') == chat_id]
-        
-        # Подсчитываем статистику
-        edited_count = len([c for c in changes if c.get('action_type') == 'edited'])
-        deleted_count = len([c for c in changes if c.get('action_type') == 'deleted'])
+        ):
+            # Фильтруем по chat_id если указан
+            if chat_id and change.get('chat_id') != chat_id:
+                continue
+
+            total_changes += 1
+            if change.get('action_type') == 'edited':
+                edited_count += 1
+            elif change.get('action_type') == 'deleted':
+                deleted_count += 1
+            if len(changes) < 100:
+                changes.append(change)
         
         return jsonify({
             'success': True,
             'changes_found': {
-                'total_changes': len(changes),
+                'total_changes': total_changes,
                 'edited_messages': edited_count,
                 'deleted_messages': deleted_count,
-                'changes': changes[:100]  # Последние 100 изменений
+                'changes': changes  # Последние 100 изменений
             },
-            'message': f'Найдено {len(changes)} изменений за последние {hours_threshold} часов'
+            'message': f'Найдено {total_changes} изменений за последние {hours_threshold} часов'
         })
     except Exception as e:
         return jsonify({
@@ -1088,12 +1094,12 @@ def api_get_chat_messages_with_changes(chat_id):
             
             # Применяем фильтр
             if filter_type == 'changed':
-                query += ''' AND (m.is_deleted = TRUE OR EXISTS (
+                query += ''' AND (m.is_deleted = 1 OR EXISTS (
                     SELECT 1 FROM message_history 
                     WHERE message_id = m.id AND chat_id = m.chat_id
                 ))'''
             elif filter_type == 'unchanged':
-                query += ''' AND m.is_deleted = FALSE AND NOT EXISTS (
+                query += ''' AND m.is_deleted = 0 AND NOT EXISTS (
                     SELECT 1 FROM message_history 
                     WHERE message_id = m.id AND chat_id = m.chat_id
                 )'''
@@ -1691,7 +1697,7 @@ def api_chats_search():
                     c.id,
                     c.name,
                     c.type,
-                    COUNT(DISTINCT m.id) as message_count
+                    COUNT(m.id) as message_count
                 FROM chats c
                 LEFT JOIN messages m ON c.id = m.chat_id
                 WHERE LOWER(c.name) LIKE LOWER(?)